@@ -0,0 +1,277 @@
+"""
+shorthand_parser 성능 측정용 스크립트.
+unittest로 돌리기엔 너무 오래 걸려서 따로 뺌.
+
+    python bench_shorthand.py
+"""
+import os
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+import old_shorthand_parser
+from concurrent.futures import ProcessPoolExecutor
+
+import shorthand_parser
+from shorthand_parser import ShorthandParser, ShorthandParseSyntaxError
+
+
+def make_flat_input(num_keys, num_values=3):
+    # Name0=a0,b0,c0,Name1=a1,b1,c1,... 같은 배치 매니페스트 모양의 긴 입력
+    return ','.join(
+        'Name%d=%s' % (i, ','.join('v%d_%d' % (i, j) for j in range(num_values)))
+        for i in range(num_keys)
+    )
+
+
+class BacktrackingParser(ShorthandParser):
+    # 비교용. lookahead 이전의 _csv_value()처럼 에러를 잡아서 한 글자씩 되돌아간다.
+    def _csv_value(self):
+        first_value = self._first_value()
+        self._consume_whitespace()
+        if self._at_eof() or self._input_value[self._index] != ',':
+            return first_value
+        self._expect(',', consume_whitespace=True)
+        csv_list = [first_value]
+        while True:
+            try:
+                current = self._second_value()
+                self._consume_whitespace()
+                if self._at_eof():
+                    csv_list.append(current)
+                    break
+                self._expect(',', consume_whitespace=True)
+                csv_list.append(current)
+            except ShorthandParseSyntaxError:
+                if self._at_eof():
+                    raise
+                while self._index >= 0 and self._input_value[self._index] != ',':
+                    self._index -= 1
+                break
+        if len(csv_list) == 1:
+            return first_value
+        return csv_list
+
+
+def parse_reference(value, parser_class=ShorthandParser):
+    # fast path를 건너뛰고 재귀 하강 파서만 사용
+    parser = parser_class()
+    parser._input_value = value
+    parser._index = 0
+    return parser._parameter()
+
+
+def bench(func, value, number):
+    return min(timeit.repeat(lambda: func(value), number=number, repeat=3)) / number
+
+
+def bench_fast_path():
+    print('== fast path vs reference ==')
+    for num_keys in (10, 100, 1000):
+        value = make_flat_input(num_keys)
+        number = max(1, 2000 // num_keys)
+        assert ShorthandParser().parse(value) == parse_reference(value)
+        reference = bench(parse_reference, value, number)
+        fast = bench(ShorthandParser().parse, value, number)
+        print('%6d bytes  reference %9.1f us  fast %9.1f us  x%.1f' % (
+            len(value), reference * 1e6, fast * 1e6, reference / fast))
+
+
+def bench_linear_scaling():
+    # 값이 수천 개인 긴 csv 리스트. 입력 크기를 두 배씩 늘려도
+    # KB당 시간이 일정하면 선형(O(n))이다.
+    print('== reference parser scaling (csv list) ==')
+    for size in (12500, 25000, 50000, 100000):
+        values = []
+        length = len('foo=')
+        while length < size:
+            values.append('value%d' % len(values))
+            length += len(values[-1]) + 1
+        value = 'foo=' + ','.join(values)
+        elapsed = bench(parse_reference, value, 3)
+        print('%7d bytes  %6d values  %8.1f ms  %6.1f us/KB' % (
+            len(value), len(values), elapsed * 1e3, elapsed * 1e6 / (len(value) / 1024)))
+
+
+def bench_csv_lookahead():
+    # foo=a,b,c=d,e=f 처럼 csv 리스트가 다음 keyval 앞에서 끝날 때마다
+    # 예전 파서는 에러를 한번 만들고 잡았다.
+    print('== csv lookahead vs backtracking ==')
+    for num_keys in (10, 100, 1000):
+        value = make_flat_input(num_keys)
+        number = max(1, 2000 // num_keys)
+        assert parse_reference(value) == parse_reference(value, BacktrackingParser)
+        backtracking = bench(lambda v: parse_reference(v, BacktrackingParser), value, number)
+        lookahead = bench(parse_reference, value, number)
+        print('%6d bytes  backtracking %9.1f us  lookahead %9.1f us  x%.1f' % (
+            len(value), backtracking * 1e6, lookahead * 1e6, backtracking / lookahead))
+
+
+def bench_error_message():
+    # 검증 스윕처럼 에러를 만들고 잡기만 할 때와 메시지(str)까지 만들 때 비교
+    print('== error: construct only vs str(error) ==')
+    for num_keys in (10, 100, 1000):
+        value = make_flat_input(num_keys).replace(',', ',\n')
+        index = len(value) // 2
+        number = 20000 // num_keys
+        construct = bench(
+            lambda v: ShorthandParseSyntaxError(v, ',', '=', index), value, number)
+        message = bench(
+            lambda v: str(ShorthandParseSyntaxError(v, ',', '=', index)), value, number)
+        print('%6d bytes  construct %8.2f us  str() %8.2f us' % (
+            len(value), construct * 1e6, message * 1e6))
+
+
+def bench_old_vs_new():
+    # initial 커밋 파서와 비교. 둘이 같은 결과를 내는 입력(공통 문법)만 쓴다.
+    # 입력이 10배씩 커질 때 시간도 10배 근처면 선형.
+    print('== old_shorthand_parser vs shorthand_parser ==')
+    for num_keys in (10, 100, 1000, 4000):
+        value = make_flat_input(num_keys)
+        number = max(1, 2000 // num_keys)
+        old_parse = lambda v: old_shorthand_parser.ShorthandParser().parse(v)
+        assert old_parse(value) == ShorthandParser().parse(value)
+        old = bench(old_parse, value, number)
+        reference = bench(parse_reference, value, number)
+        fast = bench(ShorthandParser().parse, value, number)
+        print('%6d bytes  old %10.1f us  reference %9.1f us  fast %9.1f us' % (
+            len(value), old * 1e6, reference * 1e6, fast * 1e6))
+
+
+def bench_compact_memory():
+    # 작업 큐에 파싱 결과를 잔뜩 쌓아둔 상황. 결과를 전부 들고 있을 때의 메모리 비교
+    print('== dict vs compact=True (memory held by results) ==')
+    lines = ['Name=worker-%d,Zone=zone-%d,Tags=[a,b,c],Config={Retries=3,Enabled=true}'
+             % (i % 100, i % 4) for i in range(100000)]
+    for compact in (False, True):
+        parser = ShorthandParser(compact=compact)
+        tracemalloc.start()
+        results = [parser.parse(line) for line in lines]
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('compact=%-5s  %6d results  %7.1f MB  %5d bytes/result' % (
+            compact, len(results), current / 1e6, current // len(results)))
+
+
+def bench_parse_parallel():
+    # 따옴표, 리스트, 해시가 섞여서 fast path를 못 타는 긴 입력 하나.
+    # 풀을 만드는 비용은 빼고 재사용하는 executor로 잰다.
+    print('== parse vs parse_parallel (%d cpus) ==' % (os.cpu_count() or 1))
+    parser = ShorthandParser()
+    for num_keys in (1000, 10000, 50000):
+        value = ','.join("Key%d=[a,'b,c'],Name%d={x=\"y\"},Values%d=a,b"
+                         % (i, i, i) for i in range(num_keys))
+        serial = bench(parser.parse, value, 1)
+        line = '%8d bytes  parse %8.1f ms' % (len(value), serial * 1e3)
+        for workers in (2, 4, 8):
+            with ProcessPoolExecutor(workers) as executor:
+                func = lambda v: parser.parse_parallel(v, executor=executor)
+                assert func(value) == parser.parse(value)
+                line += '  %d workers %8.1f ms' % (workers, bench(func, value, 1) * 1e3)
+        print(line)
+
+
+def bench_threaded_throughput():
+    # 스레드 풀 API 워커 상황. 요청마다 파서를 새로 만드는 것과 모듈 전역 파서 하나를 같이 쓰는 것 비교.
+    # GIL 때문에 스레드를 늘려도 합계 처리량은 비슷해야 정상이고, 공유해도 결과가 깨지지 않는지 같이 본다.
+    print('== threaded throughput (requests/s) ==')
+    values = ["Name=worker-%d,Tags=[a,b],Config={Retries=%d}" % (i, i % 5) for i in range(200)] + \
+             ["Name='quoted %d',Values=a,b,c" % i for i in range(200)]
+    expected = [ShorthandParser().parse(value) for value in values]
+    per_thread = 4000
+
+    def run(num_threads, parse):
+        failures = []
+
+        def work():
+            for i in range(per_thread):
+                if parse(values[i % len(values)]) != expected[i % len(values)]:
+                    failures.append(i)
+
+        threads = [threading.Thread(target=work) for _ in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        assert not failures
+        return num_threads * per_thread / elapsed
+
+    for num_threads in (1, 2, 4, 8):
+        print('%d threads  new parser per request %9.0f  shared module parser %9.0f' % (
+            num_threads,
+            run(num_threads, lambda value: ShorthandParser().parse(value)),
+            run(num_threads, shorthand_parser.parse)))
+
+
+def bench_begin_state():
+    # fast path를 못 타는 입력에서 _begin()의 복사본이 일반 인스턴스만큼 빠른지.
+    # bench_threaded_throughput()은 양쪽 다 _begin()을 거쳐서 여기 느려진 걸 못 본다.
+    print('== _begin() state vs plain instance (reference path) ==')
+    parser = ShorthandParser()
+    for name, template in (('nested', "Name%d=[a%d,'b c',{x=y}]"),
+                           ('hash', "Name%d={x='a %d',y=b}"),
+                           ('list', "Name%d=[a%d,'b c',d]")):
+        value = ','.join(template % (i, i) for i in range(1000))
+        begin = lambda v: parser._begin(v)._parameter()
+        assert begin(value) == parse_reference(value)
+        plain = bench(parse_reference, value, 20)
+        state = bench(begin, value, 20)
+        print('%-6s  plain instance %7.2f ms  _begin() %7.2f ms  x%.2f' % (
+            name, plain * 1e3, state * 1e3, state / plain))
+
+
+def bench_parse_file():
+    # 한 줄에 하나씩 적힌 큰 파일. 결과를 버리면서 읽을 때 메모리가 파일 크기와 상관없는지 본다.
+    print('== parse_file (mmap) ==')
+    line = "Name=worker,Tags=[a,b,c],Config={Retries=3,Enabled=true}\n"
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        for num_lines in (10000, 100000, 300000):
+            with open(path, 'w') as f:
+                f.write(line * num_lines)
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = sum(1 for _ in shorthand_parser.parse_file(path))
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert count == num_lines
+            print('%9d bytes  %8d lines  %7.2f s  %8.0f lines/s  peak %6d B' % (
+                len(line) * num_lines, num_lines, elapsed, num_lines / elapsed, peak))
+    finally:
+        os.remove(path)
+
+
+def bench_profile(lines=None):
+    # 어떤 문법 규칙이 시간을 많이 먹는지. 실제 입력 파일이 있으면 줄 목록을 넘겨서 보면 된다.
+    print('== profile by production ==')
+    if lines is None:
+        lines = [make_flat_input(10), "Name='quoted',Tags=[a,b,{c=d}]",
+                 'Values=a,b,c,Other=d,e', 'Config={Retries=3,Tags=[x,y]}'] * 250
+    parser = ShorthandParser(profile=True)
+    for line in lines:
+        parser.parse(line)
+    stats = parser.profile_stats()
+    for name in sorted((name for name in stats if isinstance(stats[name], dict) and
+                        'calls' in stats[name]), key=lambda name: -stats[name]['time']):
+        print('%-16s %8d calls  %8.1f ms' % (name, stats[name]['calls'], stats[name]['time'] * 1e3))
+    print('backtracks %d  regex %r' % (stats['backtracks'], stats['regex']))
+
+
+if __name__ == '__main__':
+    bench_old_vs_new()
+    bench_fast_path()
+    bench_linear_scaling()
+    bench_csv_lookahead()
+    bench_error_message()
+    bench_compact_memory()
+    bench_parse_parallel()
+    bench_threaded_throughput()
+    bench_begin_state()
+    bench_parse_file()
+    bench_profile()
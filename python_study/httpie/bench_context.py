@@ -0,0 +1,92 @@
+"""
+context.Environment 시작 시간과 설정 읽기 측정용 스크립트.
+CLI를 한 번 실행할 때마다 드는 비용이라 새 프로세스를 여러 번 띄워서 잰다.
+
+    python bench_context.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import config
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# 예전처럼 import할 때 터미널 정보를 전부 구하고 pprint도 import하는 경우 (흉내냄)
+EAGER = '''
+import pprint
+import context
+env = context.Environment
+env.colors, env.stdin_isatty, env.stdout_isatty, env.stderr_isatty
+context.Environment()
+'''
+# 터미널 정보를 안 읽는 실행 (출력을 파이프로 받는 스크립트, --help 등)
+LAZY = '''
+import context
+context.Environment()
+'''
+BASELINE = 'pass'
+
+
+def run(code):
+    env = dict(os.environ, TERM=os.environ.get('TERM') or 'xterm-256color')
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def bench_startup(runs=50):
+    # 번갈아 돌려서 머신 상태가 바뀌는 영향을 줄인다.
+    cases = (('baseline', BASELINE), ('eager', EAGER), ('lazy', LAZY))
+    timings = {name: [] for name, _ in cases}
+    for _ in range(runs):
+        for name, code in cases:
+            timings[name].append(run(code))
+    baseline = statistics.median(timings['baseline'])
+    for name, _ in cases[1:]:
+        print('%-5s median %6.2f ms  min %6.2f ms  (interpreter start excluded: %6.2f ms)'
+              % (name, statistics.median(timings[name]) * 1e3, min(timings[name]) * 1e3,
+                 (statistics.median(timings[name]) - baseline) * 1e3))
+
+
+def bench_importtime():
+    # -X importtime 으로 curses가 import되는지 확인
+    for name, code in (('eager', EAGER), ('lazy', LAZY)):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=HERE,
+                                capture_output=True, text=True, check=True)
+        curses = [line for line in result.stderr.splitlines() if line.rstrip().endswith('curses')]
+        print('%-5s %s' % (name, curses[-1].strip() if curses else 'curses not imported'))
+
+
+def bench_config(number=2000):
+    # 작은 설정(보통)과 큰 설정에서 Config.load() / 스냅샷 / 프로세스 캐시
+    for name, options in (('small', 3), ('large', 2000)):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'config.json'), 'w') as f:
+                json.dump({'default_options': ['--option-%d' % i for i in range(options)]}, f)
+
+            def json_load():
+                config.Config(directory).load()
+
+            def snapshot():
+                config.clear_config_cache()
+                config.get_config(directory)
+
+            def cached():
+                config.get_config(directory)
+            config.get_config(directory)
+            for label, func in (('json', json_load), ('snapshot', snapshot), ('cached', cached)):
+                elapsed = min(timeit.repeat(func, number=number, repeat=3))
+                print('config %-5s %-8s %7.2f us' % (name, label, elapsed / number * 1e6))
+        config.clear_config_cache()
+
+
+if __name__ == '__main__':
+    bench_startup()
+    bench_importtime()
+    bench_config()
@@ -0,0 +1,97 @@
+"""
+httpie_downloads 성능 측정용 스크립트.
+unittest로 돌리기엔 너무 오래 걸려서 따로 뺌.
+
+    python bench_httpie_downloads.py
+"""
+import io
+import os
+import random
+import timeit
+
+import httpie_downloads
+from httpie_downloads import (DownloadStatus, MultiProgressReporterThread,
+                              NDJSONProgressReporterThread, ProgressEventWriter,
+                              ProgressReporterThread)
+from httpie_downloads_utils import humanize_bytes, humanize_bytes_many, humanize_bytes_slow
+
+
+def make_values(count, seed=0):
+    # 리포터가 실제로 넘기는 것처럼 받은 양(int)과 속도(float)를 섞음
+    rng = random.Random(seed)
+    values = []
+    for _ in range(count // 2):
+        values.append(rng.randint(0, 1 << rng.randint(0, 40)))
+        values.append(rng.random() * (1 << rng.randint(0, 30)))
+    return values
+
+
+def bench_humanize_bytes():
+    values = make_values(10000)
+    for name, func in (('slow', humanize_bytes_slow), ('fast', humanize_bytes)):
+        elapsed = min(timeit.repeat(lambda: [func(n) for n in values], number=10, repeat=5))
+        print('humanize_bytes %-5s %6.2f us/value' % (name, elapsed / 10 / len(values) * 1e6))
+    elapsed = min(timeit.repeat(lambda: humanize_bytes_many(values), number=10, repeat=5))
+    print('humanize_bytes_many  %6.2f us/value' % (elapsed / 10 / len(values) * 1e6))
+
+
+def bench_render_loop(downloads=1000, ticks=50):
+    # 틱마다 모든 다운로드의 줄을 다시 만들도록 update_interval=0
+    values = make_values(downloads)
+    for name, func in (('slow', humanize_bytes_slow), ('fast', humanize_bytes)):
+        httpie_downloads.humanize_bytes = func
+        try:
+            statuses = []
+            for i in range(downloads):
+                status = DownloadStatus()
+                status.started(total_size=1 << 30)
+                statuses.append(status)
+            reporter = MultiProgressReporterThread(io.StringIO(), statuses, update_interval=0)
+
+            def tick():
+                for status, n in zip(statuses, values):
+                    status.chunk_downloaded(int(n) & 0xffff)
+                reporter.report()
+            elapsed = min(timeit.repeat(tick, number=ticks, repeat=3))
+
+            single = DownloadStatus()
+            single.started(total_size=1 << 30)
+            thread = ProgressReporterThread(single, io.StringIO(), update_interval=0)
+
+            def tick_single():
+                single.chunk_downloaded(1000)
+                thread.report_speed()
+            elapsed_single = min(timeit.repeat(tick_single, number=10000, repeat=3))
+        finally:
+            httpie_downloads.humanize_bytes = humanize_bytes
+        print('render %-5s MultiProgressReporterThread(%d) %6.2f ms/tick, '
+              'ProgressReporterThread %5.2f us/tick'
+              % (name, downloads, elapsed / ticks * 1e3, elapsed_single / 10000 * 1e6))
+
+
+def bench_ndjson(downloads=1000, ticks=50):
+    # 다운로드 downloads개의 이벤트를 /dev/null로. 틱당 write는 버퍼가 찰 때만
+    statuses = []
+    for i in range(downloads):
+        status = DownloadStatus()
+        status.started(total_size=1 << 30)
+        statuses.append(status)
+    fd = os.open(os.devnull, os.O_WRONLY)
+    try:
+        reporter = NDJSONProgressReporterThread(ProgressEventWriter(fd), statuses)
+
+        def tick():
+            for status in statuses:
+                status.chunk_downloaded(1000)
+            reporter.report()
+        elapsed = min(timeit.repeat(tick, number=ticks, repeat=3))
+    finally:
+        os.close(fd)
+    print('ndjson NDJSONProgressReporterThread(%d) %6.2f ms/tick (%.2f us/event)'
+          % (downloads, elapsed / ticks * 1e3, elapsed / ticks / downloads * 1e6))
+
+
+if __name__ == '__main__':
+    bench_humanize_bytes()
+    bench_render_loop()
+    bench_ndjson()
@@ -0,0 +1,6 @@
+import sys
+
+# HTTPie - compat 오픈소스를 뜯어보고 따라치면서 공부
+# https://github.com/httpie/httpie/blob/64c31d554a367abf876bd355f07dca6e41476c3f/httpie/compat.py
+
+is_windows = 'win32' in str(sys.platform).lower()
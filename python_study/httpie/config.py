@@ -0,0 +1,186 @@
+import json
+import marshal
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+from compat import is_windows
+
+# HTTPie - config 오픈소스를 뜯어보고 따라치면서 공부 (context.py의 Environment.config가 씀)
+# https://github.com/httpie/httpie/blob/64c31d554a367abf876bd355f07dca6e41476c3f/httpie/config.py
+
+ENV_XDG_CONFIG_HOME = 'XDG_CONFIG_HOME'
+ENV_HTTPIE_CONFIG_DIR = 'HTTPIE_CONFIG_DIR'
+DEFAULT_CONFIG_DIRNAME = 'httpie'
+DEFAULT_RELATIVE_XDG_CONFIG_HOME = Path('.config')
+DEFAULT_RELATIVE_LEGACY_CONFIG_DIR = Path('.httpie')
+DEFAULT_WINDOWS_CONFIG_DIR = Path(os.path.expandvars('%APPDATA%')) / DEFAULT_CONFIG_DIRNAME
+
+
+def get_default_config_dir() -> Path:
+    """
+    설정 디렉토리 찾는 순서
+    1. $HTTPIE_CONFIG_DIR
+    2. 윈도우면 %APPDATA%\\httpie
+    3. 예전 위치 ~/.httpie 가 있으면 그거
+    4. $XDG_CONFIG_HOME/httpie (없으면 ~/.config/httpie)
+    """
+    env_config_dir = os.environ.get(ENV_HTTPIE_CONFIG_DIR)
+    if env_config_dir:
+        return Path(env_config_dir)
+
+    if is_windows:
+        return DEFAULT_WINDOWS_CONFIG_DIR
+
+    home_dir = Path.home()
+
+    legacy_config_dir = home_dir / DEFAULT_RELATIVE_LEGACY_CONFIG_DIR
+    if legacy_config_dir.exists():
+        return legacy_config_dir
+
+    xdg_config_home_dir = os.environ.get(
+        ENV_XDG_CONFIG_HOME,
+        home_dir / DEFAULT_RELATIVE_XDG_CONFIG_HOME
+    )
+    return Path(xdg_config_home_dir) / DEFAULT_CONFIG_DIRNAME
+
+
+DEFAULT_CONFIG_DIR = get_default_config_dir()
+
+
+class ConfigFileError(Exception):
+    pass
+
+
+class BaseConfigDict(dict):
+    """json 파일 하나에 저장되는 dict"""
+
+    def __init__(self, path: Path):
+        super().__init__()
+        self.path = path
+
+    def is_new(self) -> bool:
+        return not self.path.exists()
+
+    def load(self):
+        config_type = type(self).__name__.lower()
+        try:
+            with self.path.open(encoding='utf8') as f:
+                try:
+                    data = json.load(f)
+                except ValueError as e:
+                    raise ConfigFileError(
+                        f'invalid {config_type} file: {e} [{self.path}]'
+                    )
+                self.update(data)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise ConfigFileError(f'cannot read {config_type} file: {e}')
+
+
+class Config(BaseConfigDict):
+    FILENAME = 'config.json'
+    DEFAULTS = {
+        'default_options': []
+    }
+
+    def __init__(self, directory=DEFAULT_CONFIG_DIR):
+        self.directory = Path(directory)
+        super().__init__(path=self.directory / self.FILENAME)
+        self.update(self.DEFAULTS)
+
+    @property
+    def default_options(self) -> list:
+        return self['default_options']
+
+
+# 스냅샷 형식이 바뀌면 올린다.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILENAME = '.config.snapshot'
+# 이보다 작은 config.json은 스냅샷을 안 쓴다. 작은 JSON은 파일을 하나 더 여는 것보다 파싱이 빠름
+# (여기서 재보니 8~16 kB 근처에서 비슷해지고 64 kB면 스냅샷이 30% 빠름. bench_context.py)
+SNAPSHOT_MIN_SIZE = 16 * 1024
+
+# str(config 파일 경로) -> ((mtime_ns, size), marshal로 직렬화한 내용)
+_cache: Dict[str, Tuple[Tuple[int, int], bytes]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_config(directory=DEFAULT_CONFIG_DIR) -> Config:
+    """
+    Config(directory).load()와 같은 Config를 돌려준다. (매번 새 객체라서 고쳐도 캐시에 영향 없음)
+
+    - 프로세스 안에서는 (디렉토리, config.json의 mtime과 크기)로 캐시해서 파일을 다시 읽지 않는다.
+    - 프로세스가 처음 읽을 때는 설정 디렉토리의 .config.snapshot(marshal)을 보고,
+      mtime과 크기가 같으면 JSON 파싱을 건너뛴다. 아니면 JSON을 읽고 스냅샷을 새로 쓴다.
+      (config.json이 SNAPSHOT_MIN_SIZE보다 클 때만)
+    - 스냅샷을 못 읽거나 못 쓰면 (권한, 다른 파이썬 버전 등) 그냥 JSON을 읽는다.
+    같은 크기로 1ns 안에 두 번 고치면 못 알아챔. 파일이 잘못됐으면 load()처럼 ConfigFileError
+    """
+    config = Config(directory=directory)
+    try:
+        stat = config.path.stat()
+    except FileNotFoundError:
+        return config
+    except OSError as e:
+        raise ConfigFileError(f'cannot read config file: {e}')
+    key = (stat.st_mtime_ns, stat.st_size)
+    path = str(config.path)
+
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        blob = cached[1]
+    else:
+        use_snapshot = stat.st_size >= SNAPSHOT_MIN_SIZE
+        snapshot_path = config.directory / SNAPSHOT_FILENAME
+        blob = _read_snapshot(snapshot_path, key) if use_snapshot else None
+        if blob is None:
+            config.load()
+            blob = marshal.dumps(dict(config))
+            if use_snapshot:
+                _write_snapshot(snapshot_path, key, blob)
+        with _cache_lock:
+            _cache[path] = (key, blob)
+    config.update(marshal.loads(blob))
+    return config
+
+
+def clear_config_cache():
+    """프로세스 캐시만 비운다. (디스크의 스냅샷은 그대로)"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _read_snapshot(snapshot_path: Path, key: Tuple[int, int]):
+    """
+    스냅샷의 blob. 없거나, 키가 다르거나, 깨졌으면 (모양이 다르거나 blob이 marshal이 아님) None
+    None이면 get_config()가 JSON을 읽으므로 여기서는 어떤 에러도 밖으로 내지 않는다.
+    """
+    try:
+        with snapshot_path.open('rb') as f:
+            snapshot = marshal.load(f)
+        version, marshal_version, snapshot_key, blob = snapshot
+        if (version, marshal_version, tuple(snapshot_key)) != (SNAPSHOT_VERSION, marshal.version, key):
+            return None
+        if not isinstance(blob, bytes) or not isinstance(marshal.loads(blob), dict):
+            return None
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return blob
+
+
+def _write_snapshot(snapshot_path: Path, key: Tuple[int, int], blob: bytes):
+    # 다른 프로세스가 반쯤 쓴 걸 읽지 않게 임시 파일에 쓰고 바꿔친다.
+    tmp_path = snapshot_path.with_name(f'{snapshot_path.name}.{os.getpid()}.tmp')
+    try:
+        with tmp_path.open('wb') as f:
+            marshal.dump((SNAPSHOT_VERSION, marshal.version, key, blob), f)
+        os.replace(tmp_path, snapshot_path)
+    except OSError:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
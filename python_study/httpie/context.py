@@ -1,53 +1,90 @@
-import curses   # 텍스트 기반 터미널 스크린 페인팅과 키보드 처리 기능 제공.
+import io
 import sys
 import os
 from pathlib import Path
 from typing import IO, Optional
+from compat import is_windows
+from config import DEFAULT_CONFIG_DIR, Config, ConfigFileError, get_config
 from httpie_downloads_utils import repr_dict
 
 
+class _lazy_class_attribute:
+    """
+    처음 읽을 때 func(cls)로 값을 구해서 클래스 속성으로 박아둔다. 그 다음부터는 그냥 클래스 속성이라
+    프로세스당 한 번만 계산함. 값을 안 읽으면 (--help 같은 것) 계산도 안 한다.
+    데이터 디스크립터가 아니라서 Environment(stdout_isatty=False)처럼 인스턴스에 준 값이 먼저다.
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __set_name__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __get__(self, instance, owner):
+        value = self.func(self.owner)
+        setattr(self.owner, self.name, value)
+        return value
+
+
+def _wrap_stream(stream):
+    import colorama.initialise  # ANSI 이스케이프 문자 시퀀스를 windows에서도 사용할 수 있게
+    return colorama.initialise.wrap_stream(
+        stream, convert=None, strip=None,
+        autoreset=True, wrap=True
+    )
+
+
+def _terminal_colors(default=256):
+    try:
+        import curses   # 텍스트 기반 터미널 스크린 페인팅과 키보드 처리 기능 제공.
+    except ImportError:
+        return default
+    try:
+        curses.setupterm()
+        return curses.tigetnum('colors')
+    except (curses.error, io.UnsupportedOperation):
+        # 터미널 정보가 없거나 stdout이 fileno() 없는 가짜 스트림일 때
+        return default
+
+
 class Environment:
     """"
     실행 context에 대한 정보. (standard streams, config directory, etc)
 
     디폴트로 실제 환경을 나타내며 모든 attribute는 테스트를 사용할 때 덮어씌워질 수 있음
+
+    터미널 정보(isatty, colors, 윈도우의 colorama)는 import할 때 구하지 않고 처음 읽을 때 구해서
+    프로세스 동안 캐시한다. (_lazy_class_attribute) 스크립트에서 수천 번 실행할 때 시작 시간을 줄이려고
     """
     is_windows: bool = is_windows
     config_dir: Path = DEFAULT_CONFIG_DIR
     stdin: Optional[IO] = sys.stdin   # fd 클로즈되면 'None' 됨
-    stdin_isatty: bool = stdin.isatty()    # isatty : 터미널 장치에 연결했는지 확인
     stdin_encoding: str = None
-    stdout: IO = sys.stdout
-    stdout_isatty: bool = stdout.isatty()
     stdout_encoding: str = None
-    stderr: IO = sys.stderr    # stout(표준출력)과 다르게 stderr은 표준 에러다. 에러로그로 활용
-    stderr_isatty: bool = stderr.isatty()
-    colors = 256
     program_name: str = 'http'
     if not is_windows:
-        if curses:
-            try:
-                curses.setupterm()
-                colors = curses.tigetnum('colors')
-            except curses.error:
-                pass
+        stdout: IO = sys.stdout
+        stderr: IO = sys.stderr    # stout(표준출력)과 다르게 stderr은 표준 에러다. 에러로그로 활용
+        colors = _lazy_class_attribute(lambda cls: _terminal_colors())
     else:
-        import colorama.initialise  # ANSI 이스케이프 문자 시퀀스를 windows에서도 사용할 수 있게
-        stdout = colorama.initialise.wrap_stream(
-            stdout, convert=None, strip=None,
-            autoreset=True, wrap=True
-        )
-        dtderr = colorama.initialise.wrap_stream(
-            stderr, convert=None, strip=None,
-            autoreset=True, wrap=True
-        )
-        del colorama
+        stdout = _lazy_class_attribute(lambda cls: _wrap_stream(sys.stdout))
+        stderr = _lazy_class_attribute(lambda cls: _wrap_stream(sys.stderr))
+        colors = 256
+
+    # isatty : 터미널 장치에 연결했는지 확인
+    stdin_isatty: bool = _lazy_class_attribute(lambda cls: bool(cls.stdin and cls.stdin.isatty()))
+    stdout_isatty: bool = _lazy_class_attribute(lambda cls: cls.stdout.isatty())
+    stderr_isatty: bool = _lazy_class_attribute(lambda cls: cls.stderr.isatty())
 
     def __init__(self, devnull=None, **kwargs):
         """
         키워드 인수를 사용해서 이 인스턴스의 클래스 속성을 덮어씀.
         """
-        assert all(hasattr(type(self), attr) for attr in kwargs.keys())
+        # hasattr()은 _lazy_class_attribute를 계산해버리므로 클래스 __dict__에서 찾는다.
+        assert all(any(attr in klass.__dict__ for klass in type(self).__mro__)
+                   for attr in kwargs.keys())
         self.__dict__.update(**kwargs)
 
         # 기존 STDERR은 --quiet’ing을 통해 영향을 안 미친다.
@@ -65,7 +102,8 @@ class Environment:
                 pass
 
     def __str__(self):
-        defaults = dict(type(self).__dict__)
+        # getattr로 읽어야 아직 안 구한 _lazy_class_attribute도 값이 나온다.
+        defaults = {key: getattr(type(self), key) for key in type(self).__dict__}
         actual = dict(defaults)
         actual.update(self.__dict__)
         actual['config'] = self.config_dir
@@ -84,4 +122,15 @@ class Environment:
     def config(self) -> Config:
         config = self._config
         if not config:
-            self._config = config = Config(directory=self.config_dir)
+            # 같은 프로세스의 다른 Environment가 읽었으면 파일을 다시 읽지 않는다. (config.get_config)
+            try:
+                config = get_config(self.config_dir)
+            except ConfigFileError as e:
+                config = Config(directory=self.config_dir)
+                self.log_error(e, level='warning')
+            self._config = config
+        return config
+
+    def log_error(self, msg, level='error'):
+        assert level in ['error', 'warning']
+        self._orig_stderr.write(f'\n{self.program_name}: {level}: {msg}\n\n')
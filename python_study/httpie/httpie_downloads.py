@@ -1,6 +1,19 @@
+import abc
+import asyncio
+import heapq
+import http.client
+import io
+import json
+import math
+import os
+import queue
 import threading
-from typing import IO   # typing: 타입 힌트를 지원. 효력은 없음.
-from time import sleep, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from operator import attrgetter
+from urllib.parse import urlsplit
+from typing import IO, Callable, Iterable, List, Optional, Union   # typing: 타입 힌트를 지원. 효력은 없음.
+from time import monotonic, sleep, time
 from httpie_downloads_utils import *
 
 # HTTPie - Reporting Download Progress 오픈소스를 뜯어보고 따라치면서 공부
@@ -15,18 +28,100 @@ PROGRESS = (
 )
 PROGRESS_NO_CONTENT_LENGTH = '{downloaded: >10} {speed: >10}/s'
 SUMMARY = 'Done. {downloaded} in {time:0.5f}s ({speed}/s)\n'
+SUMMARY_PERCENTILES = ' [p50 {p50}/s, p95 {p95}/s]'
+THROTTLED = ' (limit {limit}/s, waited {waited:.1f}s)'
 SPINNER = '|/-\\'
+CURSOR_UP = '\033[{n}A'
+CLEAR_BELOW = '\033[J'
+
+
+class ContentRangeError(ValueError):
+    pass
+
+
+class TokenBucket:
+    """
+    대역폭 제한. rate(bytes/s)만큼 토큰이 차오르고 capacity(기본 rate, 1초치)까지 모아둘 수 있다.
+    호스트 전체 제한이면 다운로드(스레드, 태스크) 전부가 하나를 같이 쓴다.
+    청크를 쓰기 전에 consume(청크 크기)(스레드) 또는 await consume_async(청크 크기)(asyncio)
+
+    토큰이 모자라도 일단 가져가고(빚), 빚을 갚을 만큼 자고 온다. 그래서 capacity보다 큰 청크도 되고
+    먼저 부른 쪽이 먼저 끝난다. 락은 토큰 계산할 때만 잡고 자는 동안에는 안 잡음
+    clock, sleep, async_sleep은 테스트에서 가짜 시계를 넣으려고 받는다.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, clock: Callable[[], float] = monotonic,
+                 sleep: Callable[[float], None] = sleep, async_sleep=asyncio.sleep):
+        if rate <= 0:
+            raise ValueError(f'rate must be positive: {rate}')
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._clock = clock
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+        # 지금까지 가져간 양과 기다리라고 한 시간의 합 (여러 스레드가 동시에 기다리면 겹쳐서 더해짐)
+        self.consumed = 0
+        self.waited = 0
+
+    def _reserve(self, amount: int, status: 'DownloadStatus' = None) -> float:
+        """amount만큼 가져가고 기다려야 할 초를 돌려준다."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            self.consumed += amount
+            self.waited += wait
+            if status is not None:
+                status.time_throttled += wait
+        return wait
+
+    def consume(self, amount: int, status: 'DownloadStatus' = None) -> float:
+        """스레드용. 필요하면 잔다. status를 주면 기다린 시간을 status.time_throttled에 더함"""
+        wait = self._reserve(amount, status)
+        if wait:
+            self._sleep(wait)
+        return wait
+
+    async def consume_async(self, amount: int, status: 'DownloadStatus' = None) -> float:
+        """asyncio용. 이벤트 루프는 막지 않고 이 태스크만 기다린다."""
+        wait = self._reserve(amount, status)
+        if wait:
+            await self._async_sleep(wait)
+        return wait
 
 
 class DownloadStatus:
     """다운로드 상태에 대한 디테일들을 가지고있음(holds)"""
 
-    def __init__(self):
+    # chunk_downloaded()를 여러 스레드에서 동시에 불러도 되는지. (+=는 원자적이지 않아서 개수가 빠질 수 있음)
+    thread_safe = False
+
+    def __init__(self, limiter: TokenBucket = None):
         self.downloaded = 0
         self.total_size = None
         self.resumed_from = 0
         self.time_started = None
         self.time_finished = None
+        # 대역폭 제한 (다른 다운로드와 같이 써도 됨)과 그걸 기다린 시간
+        self.limiter = limiter
+        self.time_throttled = 0
+        self._listeners: List[Callable[['DownloadStatus'], None]] = []
+
+    def add_listener(self, callback: Callable[['DownloadStatus'], None]):
+        """
+        chunk_downloaded()나 finished()가 불릴 때마다 callback(status)를 부른다.
+        다운로드하는 스레드에서 그대로 불리므로 callback은 가벼워야 함 (AsyncProgressReporter 참고)
+        """
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback(self)
 
     def started(self, resumed_from=0, total_size=None):
         assert self.time_started is None
@@ -37,6 +132,16 @@ class DownloadStatus:
     def chunk_downloaded(self, size):
         assert self.time_finished is None
         self.downloaded += size
+        self._notify()
+
+    def throttle(self, size):
+        """청크를 쓰기 전에 부른다. limiter가 있으면 size만큼 토큰이 찰 때까지 잔다."""
+        if self.limiter is not None:
+            self.limiter.consume(size, self)
+
+    async def throttle_async(self, size):
+        if self.limiter is not None:
+            await self.limiter.consume_async(size, self)
 
     @property
     def has_finished(self):
@@ -46,24 +151,251 @@ class DownloadStatus:
         assert self.time_started is not None
         assert self.time_finished is None
         self.time_finished = time()
+        self._notify()
+
+
+class ShardedDownloadStatus(DownloadStatus):
+    """
+    여러 스레드가 같은 파일의 청크를 받는 경우용 DownloadStatus.
+    스레드마다 자기 카운터(shard)에만 더하고, downloaded를 읽을 때 전부 합친다.
+    카운터마다 쓰는 스레드가 하나뿐이라 더하다 빠지는 일이 없고, 청크마다 락을 잡지 않음
+    (락은 스레드가 처음 청크를 보고할 때 카운터를 등록하는 한 번만)
+
+    읽는 쪽(리포터)은 조금 전 값을 볼 수는 있지만 줄어든 값을 보지는 않는다.
+    has_finished/finished()는 DownloadStatus와 같음. finished()는 모든 스레드가 끝난 뒤에 부를 것
+    """
+
+    thread_safe = True
+
+    def __init__(self, limiter: TokenBucket = None):
+        self._shards: List[List[int]] = []
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+        self._base = 0
+        super().__init__(limiter)
+
+    @property
+    def downloaded(self) -> int:
+        return self._base + sum(shard[0] for shard in list(self._shards))
+
+    @downloaded.setter
+    def downloaded(self, value: int):
+        # started()에서 resumed_from으로 맞출 때만 씀. 그때까지 더한 건 버린다.
+        with self._shards_lock:
+            self._base = value
+            for shard in self._shards:
+                shard[0] = 0
+
+    def chunk_downloaded(self, size):
+        assert self.time_finished is None
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._local.shard = [0]
+            with self._shards_lock:
+                self._shards.append(shard)
+        shard[0] += size
+        self._notify()
+
+
+def format_progress(total_size: Optional[int], downloaded: int, speed: float) -> str:
+    """진행 중인 다운로드 한 줄. (스피너 제외) total_size를 모르면 퍼센트와 ETA 없이"""
+    if not total_size:
+        return PROGRESS_NO_CONTENT_LENGTH.format(
+            downloaded=humanize_bytes(downloaded),
+            speed=humanize_bytes(speed),
+        )
+    try:
+        percentage = downloaded / total_size * 100
+    except ZeroDivisionError:
+        percentage = 0
+
+    if not speed:
+        eta = '-:--:--'
+    else:
+        s = int((total_size - downloaded) / speed)
+        h, s = divmod(s, 60 * 60)
+        m, s = divmod(s, 60)
+        eta = f'{h}:{m:0>2}:{s:0>2}'
+
+    return PROGRESS.format(
+        percentage=percentage,
+        downloaded=humanize_bytes(downloaded),
+        speed=humanize_bytes(speed),
+        eta=eta,
+    )
+
+
+def format_summary(status: DownloadStatus, estimator: 'RateEstimator' = None) -> str:
+    """끝난 다운로드의 요약 줄. ('\\n'으로 끝남) estimator를 주면 순간 속도의 p50/p95도 붙인다."""
+    actually_downloaded = (status.downloaded - status.resumed_from)
+    time_taken = status.time_finished - status.time_started
+
+    try:
+        speed = actually_downloaded / time_taken
+    except ZeroDivisionError:
+        # 아무 것도 다운되지 않았거나, 둘 다 0일 때(모든 시스템이 `time.time`을 1초보다 더 나은 정밀도로 제공하는 것은 아님
+        speed = actually_downloaded
+
+    summary = SUMMARY.format(
+        downloaded=humanize_bytes(actually_downloaded),
+        total=(status.total_size and humanize_bytes(status.total_size)),
+        speed=humanize_bytes(speed),
+        time=time_taken,
+    )
+    if estimator is not None and estimator.samples:
+        summary = summary[:-1] + SUMMARY_PERCENTILES.format(
+            p50=humanize_bytes(estimator.percentile(50)),
+            p95=humanize_bytes(estimator.percentile(95)),
+        ) + '\n'
+    return summary
+
+
+class ThroughputHistogram:
+    """
+    순간 속도(bytes/s)의 분포. 값을 저장하지 않고 로그 스케일 버킷의 개수만 세므로
+    다운로드가 몇 시간이 걸려도 메모리는 그대로다. (버킷 수 고정)
+    버킷은 2배마다 steps개라서 percentile()의 오차는 최대 2 ** (1 / steps) 배 정도
+    """
+
+    def __init__(self, steps=8, max_exponent=50):
+        self._steps = steps
+        # 0번 버킷은 1 B/s 미만(멈춘 것)
+        self._counts = [0] * (steps * max_exponent + 1)
+        self.samples = 0
+
+    def add(self, rate: float):
+        if rate < 1:
+            index = 0
+        else:
+            index = min(int(math.log2(rate) * self._steps) + 1, len(self._counts) - 1)
+        self._counts[index] += 1
+        self.samples += 1
+
+    def percentile(self, p: float) -> float:
+        """p(0~100) 퍼센타일. 샘플이 없으면 0"""
+        if not self.samples:
+            return 0
+        rank = max(1, math.ceil(self.samples * p / 100))
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                break
+        if index == 0:
+            return 0
+        # 버킷의 가운데 값 (로그 스케일)
+        return 2 ** ((index - .5) / self._steps)
+
+
+class RateEstimator(abc.ABC):
+    """
+    받은 양을 시간과 함께 update()로 넣으면 속도를 추정한다. (rate, bytes/s)
+    직전 update()와의 차이로 구한 순간 속도는 ThroughputHistogram에 쌓아서 percentile()로 볼 수 있다.
+    상태는 전부 고정 크기라서 다운로드 길이와 상관없이 O(1) 메모리
+
+    하위 클래스는 _add(rate, elapsed)에서 rate를 갱신한다.
+    """
+
+    def __init__(self):
+        self.rate = 0
+        self._histogram = ThroughputHistogram()
+        self._prev_bytes = None
+        self._prev_time = None
+
+    @property
+    def samples(self) -> int:
+        return self._histogram.samples
+
+    def update(self, downloaded: int, now: float = None) -> float:
+        if now is None:
+            now = time()
+        if self._prev_time is not None and now > self._prev_time:
+            elapsed = now - self._prev_time
+            instant = (downloaded - self._prev_bytes) / elapsed
+            self._histogram.add(instant)
+            self._add(instant, elapsed)
+        if self._prev_time is None or now > self._prev_time:
+            self._prev_bytes = downloaded
+            self._prev_time = now
+        return self.rate
+
+    def percentile(self, p: float) -> float:
+        """순간 속도의 p 퍼센타일. 미러가 느려졌는지 볼 때는 percentile(50)이 rate보다 덜 흔들림"""
+        return self._histogram.percentile(p)
+
+    @abc.abstractmethod
+    def _add(self, rate: float, elapsed: float):
+        """순간 속도 rate가 elapsed초 동안 나왔을 때 self.rate를 갱신한다."""
+
+
+class EWMARateEstimator(RateEstimator):
+    """
+    지수 가중 이동 평균. half_life초 전의 속도는 가중치가 절반이 된다.
+    update() 간격이 들쭉날쭉해도 시간 기준으로 줄어들게 가중치를 elapsed로 계산함
+    """
+
+    def __init__(self, half_life=3):
+        super().__init__()
+        self._half_life = half_life
+        self._primed = False
+
+    def _add(self, rate: float, elapsed: float):
+        if not self._primed:
+            # 첫 샘플은 0에서부터 끌어올리지 않고 그대로 쓴다.
+            self.rate = rate
+            self._primed = True
+            return
+        alpha = 1 - 0.5 ** (elapsed / self._half_life)
+        self.rate += alpha * (rate - self.rate)
+
+
+class SlidingWindowRateEstimator(RateEstimator):
+    """
+    최근 window초 동안의 평균 속도. 버킷 buckets개짜리 고리(ring)에 구간별 받은 양과 시간을 더해두므로
+    update()를 아무리 자주 불러도 메모리는 그대로다.
+    """
+
+    def __init__(self, window=5, buckets=10):
+        super().__init__()
+        self._bucket_width = window / buckets
+        self._bytes = [0.0] * buckets
+        self._elapsed = [0.0] * buckets
+        self._current = 0
+        self._current_elapsed = 0
+
+    def _add(self, rate: float, elapsed: float):
+        # 지금 버킷이 다 찼으면 다음 (가장 오래된) 버킷을 비우고 넘어간다. 오래 멈췄으면 여러 칸
+        skip = int(self._current_elapsed // self._bucket_width)
+        for _ in range(min(skip, len(self._bytes))):
+            self._current = (self._current + 1) % len(self._bytes)
+            self._bytes[self._current] = self._elapsed[self._current] = 0
+        self._current_elapsed -= skip * self._bucket_width
+        self._bytes[self._current] += rate * elapsed
+        self._elapsed[self._current] += elapsed
+        self._current_elapsed += elapsed
+        total_elapsed = sum(self._elapsed)
+        self.rate = sum(self._bytes) / total_elapsed if total_elapsed else 0
 
 
 class ProgressReporterThread(threading.Thread):
     """
     상태에 따라서 다운로드 프로그레스를 보고한다.
     상태를 주기적으로 업데이트 하기 위해서 스레딩을 함 (스피드같은거)
+    속도와 ETA는 estimator(기본은 EWMARateEstimator)로 부드럽게 해서 보여준다.
     """
 
-    def __init__(self, status: DownloadStatus, output: IO, tick=.1, update_interval=1):
+    def __init__(self, status: DownloadStatus, output: IO, tick=.1, update_interval=1,
+                 estimator: RateEstimator = None):
         super().__init__()
         self.status = status
         self.output = output
+        self.estimator = estimator if estimator is not None else EWMARateEstimator()
         self._tick = tick
         self._update_interval = update_interval
-        self._spinner_pos = ''
+        self._spinner_pos = 0
         self._status_line = ''
-        self._prev_bytes = 0
-        self._prev_time = time()
+        self._prev_time = None
         self._should_stop = threading.Event()
 
     def stop(self):
@@ -84,42 +416,19 @@ class ProgressReporterThread(threading.Thread):
 
         now = time()
 
-        if now - self._prev_time >= self._update_interval:
+        if self._prev_time is None or now - self._prev_time >= self._update_interval:
             downloaded = self.status.downloaded
-            try:
-                speed = ((downloaded - self._prev_bytes) / (now - self._prev_time))
-            except ZeroDivisionError:
-                speed = 0
-
-            if not self.status.total_size:
-                self._status_line = PROGRESS_NO_CONTENT_LENGTH.format(
-                    downloaded=humanize_bytes(downloaded),
-                    speed=humanize_bytes(speed),
-                )
-            else:
-                try:
-                    percentage = downloaded / self.status.total_size * 100
-
-                except ZeroDivisionError:
-                    percentage = 0
-
-                if not speed:
-                    eta = '-:--:--'
-                else:
-                    s = int((self.status.total_size - downloaded) / speed)
-                    h, s = divmod(s, 60 * 60)
-                    m, s = divmod(s, 60)
-                    eta = f'{h}:{m:0>2}:{s:0>2}'
-
-                self._status_line = PROGRESS.format(
-                    percentage=percentage,
-                    downloaded=humanize_bytes(downloaded),
-                    speed=humanize_bytes(speed),
-                    eta=eta,
+            speed = self.estimator.update(downloaded, now)
+
+            self._status_line = format_progress(self.status.total_size, downloaded, speed)
+            if self.status.limiter is not None:
+                # 제한 속도와 실제 속도를 같이 보여준다.
+                self._status_line += THROTTLED.format(
+                    limit=humanize_bytes(self.status.limiter.rate),
+                    waited=self.status.time_throttled,
                 )
 
             self._prev_time = now
-            self._prev_bytes = downloaded
 
         self.output.write(f'{CLEAR_LINE}  {SPINNER[self._spinner_pos]}  {self._status_line}')
         self.output.flush()
@@ -127,26 +436,664 @@ class ProgressReporterThread(threading.Thread):
         self._spinner_pos = (self._spinner_pos + 1 if self._spinner_pos + 1 != len(SPINNER) else 0)
 
     def sum_up(self):
-        actually_downloaded = (self.status.downloaded - self.status.resumed_from)
-        time_taken = self.status.time_finished - self.status.time_started
-
         self.output.write(CLEAR_LINE)
+        self.output.write(format_summary(self.status, self.estimator))
+        self.output.flush()
+
+
+class _TrackedDownload:
+    """AsyncProgressReporter가 다운로드 하나마다 들고 있는 표시용 상태"""
+
+    def __init__(self, status: DownloadStatus, label: str):
+        self.status = status
+        self.label = label
+        self.prev_bytes = status.downloaded
+        self.prev_time = time()
+        self.speed = 0
+        self.status_line = format_progress(status.total_size, status.downloaded, 0)
+
+
+class AsyncProgressReporter:
+    """
+    ProgressReporterThread의 asyncio 버전.
+    tick마다 깨어나서 확인(polling)하지 않고 DownloadStatus.chunk_downloaded() 알림을 받을 때만 다시 그린다.
+    다시 그리는 건 min_interval에 한번으로 제한하고, 그 사이에 온 알림은 다음 그리기 한번으로 합친다.
+    그래서 아무 일도 없으면 전혀 깨어나지 않음.
+
+    이벤트 루프 하나, 리포터 하나로 다운로드를 몇 개든 같이 보여준다. (다운로드마다 한 줄)
+    끝난 다운로드는 요약 줄을 위에 남기고 목록에서 빠진다.
+    알림은 다운로드하는 스레드에서 와도 되고 같은 이벤트 루프의 태스크에서 와도 된다.
+
+    example:
+        reporter = AsyncProgressReporter(sys.stderr)
+        for url, status in downloads:
+            reporter.add(status, label=url)
+        await reporter.wait()
+    """
+
+    def __init__(self, output: IO, min_interval=.1, update_interval=1):
+        self.output = output
+        self._min_interval = min_interval
+        self._update_interval = update_interval
+        self._tracked: List[_TrackedDownload] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = None
+        self._scheduled = False
+        self._last_draw = None
+        self._lines_drawn = 0
+        self._idle: Optional[asyncio.Event] = None
+        self.redraws = 0
+
+    def add(self, status: DownloadStatus, label: str = None):
+        """status를 보여주기 시작한다. 이벤트 루프 안에서 불러야 함"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._idle = asyncio.Event()
+        if label is None:
+            label = f'#{len(self._tracked) + 1}'
+        self._tracked.append(_TrackedDownload(status, label))
+        self._idle.clear()
+        status.add_listener(self._notify)
+        self._notify(status)
+
+    async def wait(self):
+        """추가한 다운로드가 전부 끝나고 요약까지 쓸 때까지 기다린다."""
+        if self._idle is not None:
+            await self._idle.wait()
 
+    def _notify(self, status: DownloadStatus):
+        # 다운로드 쪽에서 청크마다 불린다. 이미 그리기가 예약됐으면 아무것도 안 함
+        if self._scheduled:
+            return
+        self._scheduled = True
+        if threading.get_ident() == self._loop_thread:
+            self._schedule()
+        else:
+            self._loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self):
+        delay = 0
+        if self._last_draw is not None:
+            delay = max(0, self._last_draw + self._min_interval - self._loop.time())
+        self._loop.call_later(delay, self._redraw)
+
+    def _redraw(self):
+        # 여기서부터 온 알림은 다음 그리기를 예약한다. (값은 지금 읽으므로 빠지는 알림 없음)
+        self._scheduled = False
+        self._last_draw = self._loop.time()
+        now = time()
+        parts = []
+        if self._lines_drawn:
+            parts.append(CURSOR_UP.format(n=self._lines_drawn))
+        active = []
+        for tracked in self._tracked:
+            status = tracked.status
+            if status.has_finished:
+                parts.append(f'{CLEAR_LINE}{tracked.label}  {format_summary(status)}')
+                continue
+            active.append(tracked)
+            if now - tracked.prev_time >= self._update_interval:
+                downloaded = status.downloaded
+                speed = (downloaded - tracked.prev_bytes) / (now - tracked.prev_time)
+                tracked.status_line = format_progress(status.total_size, downloaded, speed)
+                tracked.prev_time = now
+                tracked.prev_bytes = downloaded
+            parts.append(f'{CLEAR_LINE}{tracked.label}  {tracked.status_line}\n')
+        parts.append(CLEAR_BELOW)
+        self._tracked = active
+        self._lines_drawn = len(active)
+        # 한 번의 write로 전부 쓴다.
+        self.output.write(''.join(parts))
+        self.output.flush()
+        self.redraws += 1
+        if not active:
+            self._idle.set()
+
+
+class MultiProgressReporterThread(threading.Thread):
+    """
+    DownloadStatus 여러 개(수천 개)를 한 화면으로 보고한다.
+    전체 합계(받은 양, 속도, ETA) 한 줄과 지금 가장 느린 다운로드 top개를 보여줌.
+
+    다운로드 수와 상관없이 tick마다 write를 딱 한 번 한다. (줄 수도 1 + top으로 고정)
+    tick마다 하는 일은 상태를 한 번 훑는 것(O(다운로드 수))과
+    heapq.nsmallest로 느린 것 top개 고르기(O(n log top))뿐이다.
+
+    example:
+        reporter = MultiProgressReporterThread(sys.stderr, top=5)
+        reporter.start()
+        for url in urls:
+            reporter.add(start_download(url), label=url)
+        ...
+        reporter.stop()
+        reporter.join()     # 마지막에 전체 요약을 한 줄 남김
+    """
+
+    def __init__(self, output: IO, statuses: Iterable[DownloadStatus] = (), tick=.1,
+                 update_interval=1, top=5):
+        super().__init__()
+        self.output = output
+        self._tick = tick
+        self._update_interval = update_interval
+        self._top = top
+        self._tracked: List[_TrackedDownload] = []
+        self._lines_drawn = 0
+        self._prev_bytes = 0
+        self._prev_time = self._time_started = time()
+        self._speed = 0
+        self._should_stop = threading.Event()
+        for status in statuses:
+            self.add(status)
+
+    def add(self, status: DownloadStatus, label: str = None):
+        """다른 스레드에서 불러도 됨 (list.append는 원자적)"""
+        if label is None:
+            label = f'#{len(self._tracked) + 1}'
+        self._tracked.append(_TrackedDownload(status, label))
+
+    def stop(self):
+        """다음 틱에 보고를 멈추고 전체 요약을 쓴다."""
+        self._should_stop.set()
+
+    def run(self):
+        while not self._should_stop.is_set():
+            self.report()
+            self._should_stop.wait(self._tick)
+        self.sum_up()
+
+    def report(self):
+        now = time()
+        update = now - self._prev_time >= self._update_interval
+        downloaded = transferred = total_size = finished = 0
+        size_known = True
+        active = []
+        for tracked in list(self._tracked):
+            status = tracked.status
+            downloaded += status.downloaded
+            # 이어받기 한 양은 속도 계산에서 뺀다.
+            transferred += status.downloaded - status.resumed_from
+            if status.total_size:
+                total_size += status.total_size
+            else:
+                size_known = False
+            if status.has_finished:
+                finished += 1
+                continue
+            if status.time_started is None:
+                # 아직 시작 안 한 건 느린 목록에 넣지 않음
+                continue
+            active.append(tracked)
+            if tracked.prev_time < status.time_started:
+                # add() 한 뒤에 started() 됐으면 이어받은 양부터 잰다.
+                tracked.prev_bytes = status.resumed_from
+                tracked.prev_time = status.time_started
+            # now는 맨 위에서 한 번만 읽으므로 그 뒤에 다른 스레드에서 started() 된 다운로드는
+            # prev_time이 now보다 늦거나 같을 수 있다. (음수 속도, ZeroDivisionError) 다음 틱에 잰다.
+            if update and now > tracked.prev_time:
+                tracked.speed = (status.downloaded - tracked.prev_bytes) / (now - tracked.prev_time)
+                tracked.prev_bytes = status.downloaded
+                tracked.prev_time = now
+                tracked.status_line = format_progress(
+                    status.total_size, status.downloaded, tracked.speed)
+        if update and now > self._prev_time:
+            self._speed = (transferred - self._prev_bytes) / (now - self._prev_time)
+            self._prev_bytes = transferred
+            self._prev_time = now
+
+        lines = [
+            f'{finished}/{len(self._tracked)} done, {len(active)} active  '
+            + format_progress(total_size if size_known else None, downloaded, self._speed)
+        ]
+        for tracked in heapq.nsmallest(self._top, active, key=attrgetter('speed')):
+            lines.append(f'  slow  {tracked.label}  {tracked.status_line}')
+
+        parts = []
+        if self._lines_drawn:
+            parts.append(CURSOR_UP.format(n=self._lines_drawn))
+        for line in lines:
+            parts.append(f'{CLEAR_LINE}{line}\n')
+        parts.append(CLEAR_BELOW)
+        self._lines_drawn = len(lines)
+        self.output.write(''.join(parts))
+        self.output.flush()
+
+    def sum_up(self):
+        downloaded = sum(tracked.status.downloaded - tracked.status.resumed_from
+                         for tracked in self._tracked)
+        time_taken = time() - self._time_started
         try:
-            speed = actually_downloaded / time_taken
+            speed = downloaded / time_taken
         except ZeroDivisionError:
-            # 아무 것도 다운되지 않았거나, 둘 다 0일 때(모든 시스템이 `time.time`을 1초보다 더 나은 정밀도로 제공하는 것은 아님
-            speed = actually_downloaded
-
-        self.output.write(SUMMARY.format(
-            downloaded=humanize_bytes(actually_downloaded),
-            total=(self.status.total_size and humanize_bytes(self.status.total_size)),
+            speed = downloaded
+        parts = []
+        if self._lines_drawn:
+            parts.append(CURSOR_UP.format(n=self._lines_drawn))
+        parts.append(CLEAR_LINE)
+        parts.append(f'{len(self._tracked)} downloads  ')
+        parts.append(SUMMARY.format(
+            downloaded=humanize_bytes(downloaded),
             speed=humanize_bytes(speed),
             time=time_taken,
         ))
+        parts.append(CLEAR_BELOW)
+        self._lines_drawn = 0
+        self.output.write(''.join(parts))
         self.output.flush()
 
 
+def progress_event(status: DownloadStatus, label: str, speed: float, now: float) -> dict:
+    """
+    NDJSON 한 줄로 내보낼 진행 이벤트. 터미널 줄(format_progress)과 같은 값을 사람 말고 기계용으로
+    끝났으면 event는 'done'이고 speed는 전체 평균 (format_summary와 같음)
+    모르는 값(total, eta, percentage)은 None (JSON에서 null)
+    """
+    downloaded = status.downloaded
+    total_size = status.total_size
+    event = {
+        'event': 'progress',
+        'id': label,
+        'time': now,
+        'downloaded': downloaded,
+        'total': total_size,
+        'resumed_from': status.resumed_from,
+        'speed': speed,
+        'eta': None,
+        'percentage': None,
+    }
+    if status.has_finished:
+        elapsed = status.time_finished - status.time_started
+        actually_downloaded = downloaded - status.resumed_from
+        event['event'] = 'done'
+        event['elapsed'] = elapsed
+        event['speed'] = actually_downloaded / elapsed if elapsed else actually_downloaded
+        event['eta'] = 0
+    elif total_size and speed:
+        event['eta'] = max(0, (total_size - downloaded) / speed)
+    if total_size:
+        event['percentage'] = downloaded / total_size * 100
+    return event
+
+
+class ProgressEventWriter:
+    """
+    진행 이벤트를 NDJSON(한 줄에 JSON 하나)으로 파일 디스크립터나 파이프에 쓴다.
+    버퍼(buffer_size)에 모았다가 flush()나 버퍼가 찰 때만 실제로 write하므로 이벤트가 많아도 시스템 콜은 적다.
+    리포터 여러 개가 하나를 같이 써도 됨 (줄이 섞이지 않게 락을 잡는다)
+
+    example:
+        writer = ProgressEventWriter(3)            # fd 3으로 컨트롤러에 보냄
+        writer = ProgressEventWriter(sys.stdout)   # 텍스트 파일이면 .buffer에 씀
+    """
+
+    def __init__(self, output: Union[int, IO], buffer_size=64 * 1024):
+        if isinstance(output, int):
+            # fd는 닫지 않는다. (만든 쪽이 닫음)
+            self._file = open(output, 'wb', buffering=buffer_size, closefd=False)
+        elif isinstance(output, io.TextIOBase):
+            output.flush()
+            self._file = output.buffer
+        else:
+            self._file = output
+        self._lock = threading.Lock()
+        self._dumps = json.JSONEncoder(separators=(',', ':'), allow_nan=False).encode
+
+    def write_events(self, events: Iterable[dict]):
+        """이벤트 여러 개를 한 번에 (버퍼에) 쓴다."""
+        dumps = self._dumps
+        data = ''.join([dumps(event) + '\n' for event in events]).encode()
+        if data:
+            with self._lock:
+                self._file.write(data)
+
+    def write_event(self, event: dict):
+        self.write_events((event,))
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+
+class NDJSONProgressReporterThread(threading.Thread):
+    """
+    ProgressReporterThread의 기계용 출력 모드. 터미널에 CLEAR_LINE으로 그리는 대신
+    interval초마다 다운로드마다 progress_event() 한 줄씩을 ProgressEventWriter로 내보낸다.
+    다운로드 여러 개(수천 개)를 스레드 하나로 보고하고, 한 번에 나온 이벤트는 write 한 번 + flush 한 번.
+    끝난 다운로드는 'done' 이벤트를 한 번 내보내고 빠진다. 속도는 다운로드마다 estimator_factory()로 만든 추정기
+
+    example:
+        reporter = NDJSONProgressReporterThread(ProgressEventWriter(3), interval=.5)
+        reporter.start()
+        reporter.add(status, label=url)
+        ...
+        reporter.stop()
+        reporter.join()
+    """
+
+    def __init__(self, writer: ProgressEventWriter, statuses: Iterable[DownloadStatus] = (),
+                 interval=1, estimator_factory: Callable[[], RateEstimator] = EWMARateEstimator):
+        super().__init__()
+        self.writer = writer
+        self._interval = interval
+        self._estimator_factory = estimator_factory
+        self._tracked = []
+        self._count = 0
+        # add()와 report()에서 끝난 다운로드를 빼는 것이 겹치지 않게
+        self._lock = threading.Lock()
+        self._should_stop = threading.Event()
+        for status in statuses:
+            self.add(status)
+
+    def add(self, status: DownloadStatus, label: str = None):
+        """다른 스레드에서 불러도 됨"""
+        with self._lock:
+            self._count += 1
+            if label is None:
+                label = f'#{self._count}'
+            self._tracked.append((status, label, self._estimator_factory()))
+
+    def stop(self):
+        """다음 틱에 멈춘다. 멈추기 전에 한 번 더 보고하고 flush함"""
+        self._should_stop.set()
+
+    def run(self):
+        while not self._should_stop.wait(self._interval):
+            self.report()
+        self.report()
+
+    def report(self):
+        now = time()
+        events = []
+        finished = set()
+        for tracked in list(self._tracked):
+            status, label, estimator = tracked
+            if status.time_started is None:
+                # 아직 시작 안 한 건 이벤트 없음
+                continue
+            speed = estimator.update(status.downloaded, now)
+            events.append(progress_event(status, label, speed, now))
+            if status.has_finished:
+                finished.add(id(tracked))
+        if finished:
+            with self._lock:
+                self._tracked = [tracked for tracked in self._tracked if id(tracked) not in finished]
+        self.writer.write_events(events)
+        self.writer.flush()
+
+
+class SegmentedDownloader:
+    """
+    파일 하나를 바이트 범위(Range)로 나눠서 커넥션 여러 개로 동시에 받는다.
+
+    - 먼저 HEAD로 크기와 Accept-Ranges를 보고, 파일을 그 크기로 미리 잡아둔다. (preallocate)
+    - segment_size씩 나눈 범위를 커넥션 풀(connections개)을 나눠 쓰는 스레드들이 받아서
+      os.pwrite()로 파일의 제자리(offset)에 바로 쓴다. seek이 없어서 스레드끼리 파일 위치를 안 다툼
+    - 진행 상황은 DownloadStatus 하나에 모은다. (ProgressReporterThread 등에 그대로 넘기면 됨)
+      기본은 ShardedDownloadStatus이고, 그냥 DownloadStatus를 넘기면 청크마다 락을 잡는다.
+    - 끝난 범위는 path + '.segments' 파일에 적어둔다. resume=True로 다시 부르면 거기 적힌 범위는 건너뛰고,
+      이미 받은 양을 status.resumed_from으로 넘긴다. 다 받으면 .segments 파일은 지운다.
+      .segments의 첫 줄에는 크기, segment_size, ETag/Last-Modified를 적어두고 하나라도 다르면 처음부터 받는다.
+      서버가 ETag도 Last-Modified도 안 주면 바뀌었는지 알 수 없으므로 이어받지 않음
+      범위 요청에는 If-Range를 붙여서, 받는 도중에 서버 파일이 바뀌면 ContentRangeError가 난다.
+    - 범위 하나가 실패하면 아직 시작 안 한 범위는 요청하지 않고, 받는 중인 범위도 다음 청크에서 멈춘다.
+    - 서버가 Range를 지원하지 않거나 크기를 안 알려주면 그냥 한 번에 받는다. (이어받기 안 됨)
+    - status.limiter(TokenBucket)가 있으면 청크를 쓰기 전마다 기다린다.
+
+    example:
+        downloader = SegmentedDownloader('http://example.com/big.iso', 'big.iso', connections=8)
+        reporter = ProgressReporterThread(downloader.status, sys.stderr)
+        reporter.start()
+        downloader.download(resume=True)
+    """
+
+    # 응답 본문을 이만큼씩 읽어서 쓰고 status에 알린다.
+    chunk_size = 64 * 1024
+
+    def __init__(self, url: str, path: str, status: DownloadStatus = None,
+                 segment_size=1 << 20, connections=4, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {url}')
+        self.url = url
+        self.path = path
+        self.status = status if status is not None else ShardedDownloadStatus()
+        self.segment_size = segment_size
+        self.connections = connections
+        self.timeout = timeout
+        self._connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                  else http.client.HTTPConnection)
+        self._netloc = parts.netloc
+        self._target = parts.path or '/'
+        if parts.query:
+            self._target += '?' + parts.query
+        self._pool: queue.Queue = queue.Queue()
+        # 그냥 DownloadStatus.chunk_downloaded()는 여러 스레드에서 부르면 +=가 겹칠 수 있음
+        self._status_lock = nullcontext() if self.status.thread_safe else threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # If-Range에 쓸 값 (ETag 또는 Last-Modified). _probe()에서 채움
+        self._validator = None
+        # 범위 하나가 실패하면 set. 받는 중인 다른 범위들이 보고 멈춘다.
+        self._cancelled = threading.Event()
+
+    @property
+    def journal_path(self) -> str:
+        return self.path + '.segments'
+
+    def download(self, resume=False) -> DownloadStatus:
+        """다 받을 때까지 블록한다. 범위 하나라도 실패하면 예외를 그대로 올림 (resume=True로 다시 부르면 됨)"""
+        try:
+            total_size, accept_ranges, header = self._probe()
+            if not total_size or not accept_ranges:
+                self._download_single(total_size)
+            else:
+                self._download_segments(header, resume)
+        finally:
+            self._close_pool()
+        self.status.finished()
+        return self.status
+
+    def segments(self, total_size: int) -> List[tuple]:
+        """[(start, end), ...] end는 Range 헤더처럼 마지막 바이트 위치 (포함)"""
+        return [(start, min(start + self.segment_size, total_size) - 1)
+                for start in range(0, total_size, self.segment_size)]
+
+    def _download_segments(self, header: dict, resume: bool):
+        total_size = header['total_size']
+        done = set()
+        if (resume and self._validator is not None
+                and os.path.exists(self.path) and os.path.getsize(self.path) == total_size):
+            done = self._read_journal(header)
+        todo = []
+        resumed_from = 0
+        for start, end in self.segments(total_size):
+            if (start, end) in done:
+                resumed_from += end - start + 1
+            else:
+                todo.append((start, end))
+
+        if not done:
+            # 새로 받는 거면 파일을 새로 만들고 크기를 잡아둔다.
+            with open(self.path, 'wb') as f:
+                self._preallocate(f.fileno(), total_size)
+            with open(self.journal_path, 'w') as journal:
+                journal.write(json.dumps(header) + '\n')
+        self.status.started(resumed_from=resumed_from, total_size=total_size)
+
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            with open(self.journal_path, 'a') as journal:
+                with ThreadPoolExecutor(max_workers=self.connections) as executor:
+                    futures = [executor.submit(self._fetch_segment, fd, journal, start, end)
+                               for start, end in todo]
+                    try:
+                        for future in as_completed(futures):
+                            future.result()
+                    except BaseException:
+                        # executor를 그냥 빠져나가면 줄 서 있는 범위를 전부 받고 나서야 예외가 올라간다.
+                        # (If-Range로 실패했으면 남은 요청마다 파일 전체가 와서 버려짐)
+                        self._cancelled.set()
+                        executor.shutdown(cancel_futures=True)
+                        raise
+        finally:
+            os.close(fd)
+        os.remove(self.journal_path)
+
+    def _fetch_segment(self, fd: int, journal: IO, start: int, end: int):
+        if self._cancelled.is_set():
+            return
+        conn = self._get_connection()
+        try:
+            headers = {'Range': f'bytes={start}-{end}'}
+            if self._validator is not None:
+                # 서버 파일이 바뀌었으면 206 대신 200(파일 전체)이 온다.
+                headers['If-Range'] = self._validator
+            conn.request('GET', self._target, headers=headers)
+            response = conn.getresponse()
+            if response.status == 200 and self._validator is not None:
+                raise ContentRangeError(
+                    f'{self.url} changed on the server while downloading (If-Range)')
+            if response.status != 206:
+                response.read()
+                raise ContentRangeError(
+                    f'Unexpected status {response.status} for bytes={start}-{end}')
+            content_range = response.getheader('Content-Range', '')
+            if not content_range.startswith(f'bytes {start}-{end}/'):
+                response.read()
+                raise ContentRangeError(
+                    f'Invalid Content-Range {content_range!r} for bytes={start}-{end}')
+            offset = start
+            while offset <= end:
+                if self._cancelled.is_set():
+                    # 다른 범위가 실패함. 받다 만 범위는 .segments에 안 적으므로 이어받을 때 다시 받는다.
+                    conn.close()
+                    return
+                chunk = response.read(min(self.chunk_size, end - offset + 1))
+                if not chunk:
+                    raise ContentRangeError(
+                        f'Connection closed at {offset} for bytes={start}-{end}')
+                self.status.throttle(len(chunk))
+                self._write_at(fd, chunk, offset)
+                offset += len(chunk)
+                with self._status_lock:
+                    self.status.chunk_downloaded(len(chunk))
+        except BaseException:
+            # 다른 스레드들이 메인 스레드를 기다리지 않고 바로 멈추게
+            self._cancelled.set()
+            # 응답을 다 안 읽은 커넥션은 다시 못 쓴다.
+            conn.close()
+            raise
+        self._pool.put(conn)
+        with self._journal_lock:
+            journal.write(f'{start}-{end}\n')
+            journal.flush()
+
+    def _download_single(self, total_size: Optional[int]):
+        self.status.started(total_size=total_size)
+        conn = self._get_connection()
+        try:
+            conn.request('GET', self._target)
+            response = conn.getresponse()
+            if response.status != 200:
+                response.read()
+                raise ContentRangeError(f'Unexpected status {response.status}')
+            with open(self.path, 'wb') as f:
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    self.status.throttle(len(chunk))
+                    f.write(chunk)
+                    self.status.chunk_downloaded(len(chunk))
+        finally:
+            conn.close()
+
+    def _probe(self):
+        """
+        (크기, Range 지원 여부, .segments 첫 줄에 적을 dict). 크기를 모르면 None
+        If-Range에 쓸 값도 self._validator에 넣는다. (약한 ETag는 If-Range에 못 써서 Last-Modified로)
+        """
+        conn = self._get_connection()
+        try:
+            conn.request('HEAD', self._target)
+            response = conn.getresponse()
+            response.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._pool.put(conn)
+        if response.status != 200:
+            return None, False, None
+        length = response.getheader('Content-Length')
+        total_size = int(length) if length is not None else None
+        accept_ranges = response.getheader('Accept-Ranges', '').strip().lower() == 'bytes'
+        etag = response.getheader('ETag')
+        last_modified = response.getheader('Last-Modified')
+        if etag is not None and not etag.startswith('W/'):
+            self._validator = etag
+        else:
+            self._validator = last_modified
+        header = {
+            'total_size': total_size,
+            'segment_size': self.segment_size,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+        return total_size, accept_ranges, header
+
+    def _get_connection(self) -> http.client.HTTPConnection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._connection_class(self._netloc, timeout=self.timeout)
+
+    def _close_pool(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _read_journal(self, header: dict) -> set:
+        """끝난 {(start, end), ...}. 첫 줄이 header와 다르면 (서버 파일이나 segment_size가 바뀜) 빈 set"""
+        try:
+            with open(self.journal_path) as journal:
+                if json.loads(journal.readline()) != header:
+                    return set()
+                done = set()
+                for line in journal:
+                    # 쓰다가 죽었으면 마지막 줄이 잘렸을 수 있음. 그 범위는 다시 받는다.
+                    if line.endswith('\n'):
+                        start, end = line.split('-')
+                        done.add((int(start), int(end)))
+                return done
+        except (OSError, ValueError):
+            return set()
+
+    @staticmethod
+    def _preallocate(fd: int, size: int):
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                # 파일 시스템이 지원 안 하면 (tmpfs 등) 구멍 난 파일로
+                pass
+        os.ftruncate(fd, size)
+
+    def _write_at(self, fd: int, data: bytes, offset: int):
+        if hasattr(os, 'pwrite'):
+            while data:
+                written = os.pwrite(fd, data, offset)
+                data = data[written:]
+                offset += written
+        else:
+            # 윈도우에는 pwrite가 없음. seek과 write 사이에 다른 스레드가 끼지 않게
+            with self._write_lock, open(fd, 'r+b', closefd=False) as f:
+                f.seek(offset)
+                f.write(data)
+
+
 if __name__ == '__main__':
     thread = ProgressReporterThread()
-    print(thread.status())
\ No newline at end of file
+    print(thread.status())
@@ -1,11 +1,71 @@
-from pprint import pformat
+from typing import Iterable, List
 
 
 def repr_dict(d: dict) -> str:
+    # pprint는 dataclasses, inspect까지 끌고 와서 import가 느리다. (context.py 시작 시간) 쓸 때만 import
+    from pprint import pformat
     return pformat(d)
 
 
+_UNITS = ('B', 'kB', 'MB', 'GB', 'TB', 'PB')
+# 단위별 나눌 값. 1 << 10 * i
+_FACTORS = tuple(1 << 10 * i for i in range(len(_UNITS)))
+# precision별 포맷 문자열 ('%.2f kB' 같은 것) 캐시
+_FORMATS = {}
+
+
+def _formats(precision):
+    formats = _FORMATS.get(precision)
+    if formats is None:
+        formats = _FORMATS[precision] = tuple(f'%.{precision}f {unit}' for unit in _UNITS)
+    return formats
+
+
 def humanize_bytes(n, precision=2):
+    """
+    humanize_bytes_slow()와 결과는 같다. 리포터가 틱마다 다운로드당 몇 번씩 부르므로 빠른 버전.
+    단위를 6개 임계값과 차례로 비교하지 않고 int.bit_length()로 바로 구함
+    (2 ** 10 이상이면 kB, 2 ** 20 이상이면 MB, ... 즉 (비트 수 - 1) // 10번째 단위)
+    """
+    if n == 1:
+        return '1 B'
+    if n >= 1024:
+        try:
+            index = (int(n).bit_length() - 1) // 10
+        except OverflowError:
+            # inf
+            return humanize_bytes_slow(n, precision)
+        if index > 5:
+            index = 5
+        return _formats(precision)[index] % (n / _FACTORS[index])
+    # 1 kB 미만, 음수, nan
+    return _formats(precision)[0] % n
+
+
+def humanize_bytes_many(values: Iterable, precision=2) -> List[str]:
+    """humanize_bytes()를 여러 값에 한 번에. 리포터가 한 화면을 그릴 때처럼 값이 많을 때 씀"""
+    formats = _formats(precision)
+    factors = _FACTORS
+    result = []
+    append = result.append
+    for n in values:
+        if n == 1:
+            append('1 B')
+        elif n >= 1024:
+            try:
+                index = (int(n).bit_length() - 1) // 10
+            except OverflowError:
+                append(humanize_bytes_slow(n, precision))
+                continue
+            if index > 5:
+                index = 5
+            append(formats[index] % (n / factors[index]))
+        else:
+            append(formats[0] % n)
+    return result
+
+
+def humanize_bytes_slow(n, precision=2):
     # Author: Doug Latornell
     # Licence: MIT
     # URL: https://code.activestate.com/recipes/577081/
@@ -0,0 +1,108 @@
+import json
+import marshal
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import config
+from config import SNAPSHOT_FILENAME, SNAPSHOT_VERSION, ConfigFileError, clear_config_cache, get_config
+
+
+class TestGetConfig(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.path = os.path.join(self.directory, 'config.json')
+        self.addCleanup(clear_config_cache)
+        clear_config_cache()
+        # 테스트 설정은 작으므로 스냅샷을 항상 쓰게
+        patcher = mock.patch('config.SNAPSHOT_MIN_SIZE', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, data):
+        with open(self.path, 'w') as f:
+            f.write(data if isinstance(data, str) else json.dumps(data))
+
+    def test_no_config_file(self):
+        self.assertEqual(get_config(self.directory), {'default_options': []})
+        self.assertFalse(os.path.exists(os.path.join(self.directory, SNAPSHOT_FILENAME)))
+
+    def test_cached_in_process(self):
+        self.write({'default_options': ['--verbose']})
+        first = get_config(self.directory)
+        with mock.patch('config.json.load', side_effect=AssertionError('parsed again')), \
+                mock.patch('config._read_snapshot', side_effect=AssertionError('read again')):
+            second = get_config(self.directory)
+        self.assertEqual(second.default_options, ['--verbose'])
+        # 돌려준 Config를 고쳐도 다음 결과에는 영향 없음
+        second.default_options.append('--pretty=none')
+        self.assertEqual(get_config(self.directory).default_options, ['--verbose'])
+        self.assertEqual(first.default_options, ['--verbose'])
+
+    def test_snapshot_skips_json(self):
+        self.write({'default_options': ['--verbose'], 'x': [1, 2.5, None, True]})
+        expected = get_config(self.directory)
+        self.assertTrue(os.path.exists(os.path.join(self.directory, SNAPSHOT_FILENAME)))
+        # 새 프로세스인 셈
+        clear_config_cache()
+        with mock.patch('config.json.load', side_effect=AssertionError('parsed again')):
+            self.assertEqual(get_config(self.directory), expected)
+
+    def test_no_snapshot_for_small_config(self):
+        self.write({'default_options': ['--verbose']})
+        with mock.patch('config.SNAPSHOT_MIN_SIZE', 1024):
+            self.assertEqual(get_config(self.directory).default_options, ['--verbose'])
+        self.assertEqual(os.listdir(self.directory), ['config.json'])
+
+    def test_invalidated_when_file_changes(self):
+        self.write({'default_options': ['--verbose']})
+        get_config(self.directory)
+        self.write({'default_options': ['--verbose', '--pretty=none']})
+        self.assertEqual(get_config(self.directory).default_options, ['--verbose', '--pretty=none'])
+        clear_config_cache()
+        self.assertEqual(get_config(self.directory).default_options, ['--verbose', '--pretty=none'])
+
+    def test_bad_snapshot_falls_back_to_json(self):
+        self.write({'default_options': ['--verbose']})
+        stat = os.stat(self.path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        snapshots = [
+            b'garbage',
+            marshal.dumps(None),
+            marshal.dumps((1, 2)),
+            marshal.dumps((SNAPSHOT_VERSION, marshal.version, 5, b'')),
+            # 키는 맞는데 blob이 깨짐
+            marshal.dumps((SNAPSHOT_VERSION, marshal.version, key, b'\xffbad')),
+            marshal.dumps((SNAPSHOT_VERSION, marshal.version, key, 'not bytes')),
+            marshal.dumps((SNAPSHOT_VERSION, marshal.version, key, marshal.dumps([1, 2]))),
+        ]
+        for snapshot in snapshots:
+            with self.subTest(snapshot=snapshot):
+                clear_config_cache()
+                with open(os.path.join(self.directory, SNAPSHOT_FILENAME), 'wb') as f:
+                    f.write(snapshot)
+                self.assertEqual(get_config(self.directory).default_options, ['--verbose'])
+        # JSON을 읽고 스냅샷을 다시 썼으므로 다음에는 JSON을 안 읽음
+        clear_config_cache()
+        with mock.patch('config.json.load', side_effect=AssertionError('parsed again')):
+            self.assertEqual(get_config(self.directory).default_options, ['--verbose'])
+
+    def test_read_only_directory(self):
+        self.write({'default_options': ['--verbose']})
+        with mock.patch('config.os.replace', side_effect=PermissionError):
+            self.assertEqual(get_config(self.directory).default_options, ['--verbose'])
+        self.assertEqual(os.listdir(self.directory), ['config.json'])
+
+    def test_invalid_json(self):
+        self.write('{')
+        with self.assertRaises(ConfigFileError):
+            get_config(self.directory)
+        self.assertNotIn(self.path, config._cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import io
+import os
+import tempfile
+import unittest
+
+from context import Environment, _lazy_class_attribute
+
+
+class TestLazyClassAttribute(unittest.TestCase):
+    def test_computed_once_on_first_read(self):
+        calls = []
+
+        class Env:
+            colors = _lazy_class_attribute(lambda cls: calls.append(cls) or 256)
+
+        self.assertEqual(calls, [])
+        self.assertEqual(Env().colors, 256)
+        self.assertEqual(Env.colors, 256)
+        self.assertEqual(calls, [Env])
+        self.assertEqual(Env.__dict__['colors'], 256)
+
+    def test_instance_value_wins(self):
+        calls = []
+
+        class Env:
+            colors = _lazy_class_attribute(lambda cls: calls.append(cls) or 256)
+
+        env = Env()
+        env.colors = 8
+        self.assertEqual(env.colors, 8)
+        self.assertEqual(calls, [])
+
+
+class TestEnvironment(unittest.TestCase):
+    def test_overrides(self):
+        stdout = io.StringIO()
+        env = Environment(stdout=stdout, stdout_isatty=False, colors=8)
+        self.assertIs(env.stdout, stdout)
+        self.assertEqual((env.stdout_isatty, env.colors), (False, 8))
+        self.assertIsInstance(env.stderr_isatty, bool)
+        with self.assertRaises(AssertionError):
+            Environment(no_such_attribute=1)
+
+    def test_config(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'config.json'), 'w') as f:
+                f.write('{"default_options": ["--verbose"]}')
+            env = Environment(config_dir=directory)
+            self.assertEqual(env.config.default_options, ['--verbose'])
+
+            with open(os.path.join(directory, 'config.json'), 'w') as f:
+                f.write('{')
+            stderr = io.StringIO()
+            env = Environment(config_dir=directory, stderr=stderr)
+            self.assertEqual(env.config.default_options, [])
+            self.assertIn('http: warning: invalid config file', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,662 @@
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from httpie_downloads import (AsyncProgressReporter, ContentRangeError, DownloadStatus,
+                              EWMARateEstimator, MultiProgressReporterThread,
+                              NDJSONProgressReporterThread, ProgressEventWriter,
+                              ProgressReporterThread, RateEstimator, SegmentedDownloader,
+                              ShardedDownloadStatus,
+                              SlidingWindowRateEstimator, ThroughputHistogram, TokenBucket,
+                              format_summary)
+from httpie_downloads_utils import humanize_bytes, humanize_bytes_many, humanize_bytes_slow
+
+
+class TestHumanizeBytes(unittest.TestCase):
+    def test_same_as_slow(self):
+        rng = random.Random(0)
+        values = [0, 1, 1.0, -5, 1023, 1023.999, 1024, 1024.0, 1 << 50, 1 << 60,
+                  float('inf'), float('nan'), .5]
+        for _ in range(2000):
+            values.append(rng.randint(0, 1 << rng.randint(0, 60)))
+            values.append(rng.random() * (1 << rng.randint(0, 60)))
+        for precision in (0, 1, 2):
+            expected = [humanize_bytes_slow(n, precision) for n in values]
+            self.assertEqual([humanize_bytes(n, precision) for n in values], expected)
+            self.assertEqual(humanize_bytes_many(values, precision), expected)
+
+    def test_examples(self):
+        self.assertEqual(humanize_bytes(1), '1 B')
+        self.assertEqual(humanize_bytes(1024, precision=1), '1.0 kB')
+        self.assertEqual(humanize_bytes(1024 * 1234 * 1111), '1.31 GB')
+        self.assertEqual(humanize_bytes(1 << 60), '1024.00 PB')
+
+
+class TestDownloadStatusListener(unittest.TestCase):
+    def test_notified_on_chunk_and_finish(self):
+        status = DownloadStatus()
+        calls = []
+        status.add_listener(lambda s: calls.append(s.downloaded))
+        status.started(total_size=10)
+        status.chunk_downloaded(4)
+        status.chunk_downloaded(6)
+        status.finished()
+        self.assertEqual(calls, [4, 10, 10])
+
+
+class TestShardedDownloadStatus(unittest.TestCase):
+    def test_many_writers(self):
+        status = ShardedDownloadStatus()
+        status.started(resumed_from=5, total_size=None)
+        calls = []
+        status.add_listener(lambda s: calls.append(1))
+
+        def download():
+            for _ in range(20000):
+                status.chunk_downloaded(1)
+
+        # 스레드 전환을 최대한 자주 일으킨다.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=download) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(status.downloaded, 5 + 8 * 20000)
+        self.assertEqual(len(calls), 8 * 20000)
+        self.assertFalse(status.has_finished)
+        status.finished()
+        self.assertTrue(status.has_finished)
+        with self.assertRaises(AssertionError):
+            status.chunk_downloaded(1)
+
+    def test_same_as_download_status(self):
+        for status in (DownloadStatus(), ShardedDownloadStatus()):
+            self.assertEqual(status.downloaded, 0)
+            status.started(resumed_from=10, total_size=100)
+            status.chunk_downloaded(30)
+            self.assertEqual((status.downloaded, status.resumed_from), (40, 10))
+            status.finished()
+            self.assertIn('Done. 30.00 B', format_summary(status))
+
+
+class TestRateEstimators(unittest.TestCase):
+    def feed(self, estimator, chunks, interval=1.0):
+        downloaded = 0
+        rates = []
+        estimator.update(0, 0.0)
+        for i, chunk in enumerate(chunks, 1):
+            downloaded += chunk
+            rates.append(estimator.update(downloaded, i * interval))
+        return rates
+
+    def test_histogram_percentile(self):
+        histogram = ThroughputHistogram()
+        self.assertEqual(histogram.percentile(50), 0)
+        for rate in range(1, 1001):
+            histogram.add(rate)
+        histogram.add(0)
+        # 버킷 폭(2 ** (1 / 8)) 안의 오차
+        self.assertAlmostEqual(histogram.percentile(50) / 500, 1, delta=.1)
+        self.assertAlmostEqual(histogram.percentile(95) / 950, 1, delta=.1)
+        self.assertEqual(histogram.percentile(0), 0)
+
+    def test_ewma_smooths_bursts(self):
+        # 1초 걸러 200 kB씩 들어오는 링크. 평균은 100 kB/s
+        rates = self.feed(EWMARateEstimator(half_life=3), [200000, 0] * 30)
+        for rate in rates[-10:]:
+            self.assertAlmostEqual(rate / 100000, 1, delta=.25)
+
+    def test_sliding_window_average(self):
+        estimator = SlidingWindowRateEstimator(window=4, buckets=4)
+        rates = self.feed(estimator, [100] * 10 + [500] * 10, interval=.5)
+        self.assertEqual(rates[9], 200)
+        self.assertEqual(rates[-1], 1000)
+        # 중간: 예전 속도가 창에서 빠지는 중
+        self.assertTrue(200 < rates[13] < 1000)
+
+    def test_subclass_must_implement_add(self):
+        class NoAdd(RateEstimator):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoAdd()
+        with self.assertRaises(TypeError):
+            RateEstimator()
+
+    def test_state_is_bounded(self):
+        estimator = SlidingWindowRateEstimator()
+        self.feed(estimator, [1000] * 10000, interval=.01)
+        self.assertEqual(len(estimator._bytes), 10)
+        self.assertEqual(estimator.samples, 10000)
+        self.assertAlmostEqual(estimator.percentile(50) / 100000, 1, delta=.1)
+
+    def test_reporter_uses_estimator(self):
+        status = DownloadStatus()
+        status.started(total_size=10 * 1000)
+        output = io.StringIO()
+        reporter = ProgressReporterThread(status, output, update_interval=1,
+                                          estimator=EWMARateEstimator(half_life=1))
+        with mock.patch('httpie_downloads.time', side_effect=[100.0, 101.0, 102.0]):
+            reporter.report_speed()
+            status.chunk_downloaded(1000)
+            reporter.report_speed()
+            status.chunk_downloaded(3000)
+            reporter.report_speed()
+        # 순간 속도 1000, 3000 -> 1000 + (3000 - 1000) / 2
+        self.assertIn('1.95 kB/s', output.getvalue())
+        self.assertEqual(reporter.estimator.samples, 2)
+        status.finished()
+        reporter.sum_up()
+        self.assertRegex(output.getvalue(), r'Done\. 3\.91 kB .*\[p50 .*/s, p95 .*/s\]\n$')
+
+
+class TestAsyncProgressReporter(unittest.IsolatedAsyncioTestCase):
+    async def download(self, status, chunks, size=100):
+        status.started(total_size=chunks * size)
+        for _ in range(chunks):
+            status.chunk_downloaded(size)
+            await asyncio.sleep(0)
+        status.finished()
+
+    async def test_multiplexes_and_rate_limits(self):
+        output = io.StringIO()
+        reporter = AsyncProgressReporter(output, min_interval=.05)
+        statuses = [DownloadStatus() for _ in range(20)]
+        for i, status in enumerate(statuses):
+            reporter.add(status, label=f'file{i}')
+        await asyncio.gather(*(self.download(status, 200) for status in statuses))
+        await asyncio.wait_for(reporter.wait(), 5)
+        # 청크 알림은 4000번이지만 다시 그리는 건 몇 번뿐
+        self.assertLess(reporter.redraws, 20)
+        text = output.getvalue()
+        for i in range(20):
+            self.assertIn(f'file{i}  Done. 19.53 kB', text)
+
+    async def test_no_redraw_without_notifications(self):
+        output = io.StringIO()
+        reporter = AsyncProgressReporter(output, min_interval=.01)
+        status = DownloadStatus()
+        reporter.add(status)
+        status.started(total_size=100)
+        await asyncio.sleep(.05)
+        redraws = reporter.redraws
+        await asyncio.sleep(.1)
+        self.assertEqual(reporter.redraws, redraws)
+        status.chunk_downloaded(100)
+        status.finished()
+        await asyncio.wait_for(reporter.wait(), 5)
+        self.assertIn('#1  Done. 100.00 B', output.getvalue())
+
+    async def test_notifications_from_threads(self):
+        output = io.StringIO()
+        reporter = AsyncProgressReporter(output, min_interval=.01)
+        statuses = [DownloadStatus() for _ in range(4)]
+        for status in statuses:
+            reporter.add(status)
+
+        def download(status):
+            status.started()
+            for _ in range(1000):
+                status.chunk_downloaded(10)
+            status.finished()
+
+        threads = [threading.Thread(target=download, args=(status,)) for status in statuses]
+        for thread in threads:
+            thread.start()
+        await asyncio.wait_for(reporter.wait(), 5)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(output.getvalue().count('Done. 9.77 kB'), 4)
+
+
+class TestMultiProgressReporterThread(unittest.TestCase):
+    def make_statuses(self, now):
+        statuses = []
+        for i in range(100):
+            status = DownloadStatus()
+            with mock.patch('httpie_downloads.time', return_value=now):
+                status.started(total_size=1000)
+            statuses.append(status)
+        return statuses
+
+    def test_aggregate_and_slowest(self):
+        output = mock.Mock()
+        with mock.patch('httpie_downloads.time', return_value=100.0):
+            statuses = self.make_statuses(100.0)
+            reporter = MultiProgressReporterThread(output, statuses, update_interval=1, top=3)
+        for i, status in enumerate(statuses):
+            status.chunk_downloaded(i + 1)
+        statuses[0].chunk_downloaded(999)
+        with mock.patch('httpie_downloads.time', return_value=101.0):
+            statuses[0].finished()
+        with mock.patch('httpie_downloads.time', return_value=102.0):
+            reporter.report()
+        # 다운로드가 100개여도 write는 한 번
+        output.write.assert_called_once()
+        lines = output.write.call_args[0][0].split('\n')
+        self.assertIn('1/100 done, 99 active', lines[0])
+        self.assertIn('5.91 kB', lines[0])      # (1 + 2 + ... + 100) + 999 bytes
+        self.assertIn('2.95 kB/s', lines[0])
+        # 끝난 #1은 빼고 가장 느린 #2, #3, #4
+        self.assertEqual([line.split('slow')[1].split()[0] for line in lines[1:4]], ['#2', '#3', '#4'])
+        self.assertEqual(len(lines), 5)
+
+        output.reset_mock()
+        with mock.patch('httpie_downloads.time', return_value=102.5):
+            reporter.report()
+        self.assertTrue(output.write.call_args[0][0].startswith('\033[4A'))
+
+    def test_started_after_now(self):
+        # report()가 now를 읽은 뒤에 다른 스레드에서 started() 된 경우 (같은 시각이거나 더 늦음)
+        output = mock.Mock()
+        with mock.patch('httpie_downloads.time', return_value=100.0):
+            reporter = MultiProgressReporterThread(output, update_interval=1, top=3)
+            statuses = [DownloadStatus() for _ in range(3)]
+            for status in statuses:
+                reporter.add(status)
+        for status, started in zip(statuses, (100.5, 101.0, 101.5)):
+            with mock.patch('httpie_downloads.time', return_value=started):
+                status.started(total_size=1000)
+            status.chunk_downloaded(100)
+        with mock.patch('httpie_downloads.time', return_value=101.0):
+            reporter.report()
+        self.assertEqual([tracked.speed for tracked in reporter._tracked], [200, 0, 0])
+
+        with mock.patch('httpie_downloads.time', return_value=102.0):
+            reporter.report()
+        self.assertEqual([tracked.speed for tracked in reporter._tracked], [0, 100, 200])
+
+    def test_run_and_sum_up(self):
+        output = io.StringIO()
+        reporter = MultiProgressReporterThread(output, tick=.01)
+        reporter.start()
+        status = DownloadStatus()
+        reporter.add(status, label='a')
+        status.started(resumed_from=10)
+        status.chunk_downloaded(90)
+        status.finished()
+        reporter.stop()
+        reporter.join(5)
+        self.assertFalse(reporter.is_alive())
+        self.assertIn('1 downloads  Done. 90.00 B', output.getvalue())
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    # server.data를 Range 요청으로 내려준다. server.fail_ranges에 있는 start는 한 번 500을 준다.
+    # ETag는 server.etag (None이면 안 보냄). If-Range가 다르면 200으로 파일 전체
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.data)))
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if self.server.etag is not None:
+            self.send_header('ETag', self.server.etag)
+        self.end_headers()
+
+    def do_GET(self):
+        data = self.server.data
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        with self.server.lock:
+            self.server.requests.append(match and int(match.group(1)))
+            fail = match and int(match.group(1)) in self.server.fail_ranges
+            if fail:
+                self.server.fail_ranges.discard(int(match.group(1)))
+        if fail:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if_range = self.headers.get('If-Range')
+        if not match or not self.server.accept_ranges or (if_range and if_range != self.server.etag):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        start, end = int(match.group(1)), int(match.group(2))
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start:end + 1])
+
+
+class TestNDJSONProgressReporterThread(unittest.TestCase):
+    def setUp(self):
+        read_fd, self.write_fd = os.pipe()
+        self.pipe = open(read_fd, 'rb')
+        self.addCleanup(self.pipe.close)
+        self.addCleanup(os.close, self.write_fd)
+
+    def read_events(self, count):
+        return [json.loads(self.pipe.readline()) for _ in range(count)]
+
+    def test_events(self):
+        writer = ProgressEventWriter(self.write_fd)
+        statuses = [DownloadStatus() for _ in range(3)]
+        reporter = NDJSONProgressReporterThread(writer, statuses[:2], interval=1)
+        with mock.patch('httpie_downloads.time', return_value=100.0):
+            statuses[0].started(total_size=1000)
+            statuses[1].started(resumed_from=100)
+            reporter.add(statuses[2], label='c')
+            reporter.report()
+        statuses[0].chunk_downloaded(250)
+        statuses[1].chunk_downloaded(50)
+        with mock.patch('httpie_downloads.time', return_value=101.0):
+            statuses[1].finished()
+            reporter.report()
+        with mock.patch('httpie_downloads.time', return_value=102.0):
+            reporter.report()
+
+        first = self.read_events(2)
+        self.assertEqual([event['id'] for event in first], ['#1', '#2'])
+        self.assertEqual(first[0]['eta'], None)
+        self.assertEqual(first[0]['percentage'], 0)
+
+        progress, done = self.read_events(2)
+        self.assertEqual(progress, {
+            'event': 'progress', 'id': '#1', 'time': 101.0, 'downloaded': 250, 'total': 1000,
+            'resumed_from': 0, 'speed': 250.0, 'eta': 3.0, 'percentage': 25.0,
+        })
+        self.assertEqual(done['event'], 'done')
+        self.assertEqual((done['downloaded'], done['resumed_from']), (150, 100))
+        self.assertEqual((done['speed'], done['elapsed'], done['percentage']), (50.0, 1.0, None))
+
+        # 끝난 #2는 한 번만, 시작 안 한 c는 안 나옴
+        self.assertEqual([event['id'] for event in self.read_events(1)], ['#1'])
+        self.assertEqual(len(reporter._tracked), 2)
+
+    def test_buffered_until_flush(self):
+        writer = ProgressEventWriter(self.write_fd)
+        with mock.patch('os.write') as write:
+            for i in range(100):
+                writer.write_event({'n': i})
+            write.assert_not_called()
+        writer.flush()
+        self.assertEqual([event['n'] for event in self.read_events(100)], list(range(100)))
+
+    def test_run_and_stop(self):
+        output = io.BytesIO()
+        reporter = NDJSONProgressReporterThread(ProgressEventWriter(output), interval=.01)
+        reporter.start()
+        status = DownloadStatus()
+        reporter.add(status)
+        status.started(total_size=10)
+        status.chunk_downloaded(10)
+        status.finished()
+        reporter.stop()
+        reporter.join(5)
+        events = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertEqual(events[-1]['percentage'], 100)
+        self.assertEqual(sum(event['event'] == 'done' for event in events), 1)
+
+
+class FakeClock:
+    # TokenBucket용 가짜 시계. sleep()하면 시간이 그만큼 간다.
+    def __init__(self, now=0.0, advance=True):
+        self.now = now
+        self.advance = advance
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if self.advance:
+            self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+
+    def bucket(self, rate, capacity=None):
+        return TokenBucket(rate, capacity, clock=self, sleep=self.sleep, async_sleep=self.async_sleep)
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        clock = FakeClock()
+        bucket = clock.bucket(rate=1000, capacity=500)
+        # 처음에는 capacity만큼 바로
+        self.assertEqual(bucket.consume(500), 0)
+        self.assertEqual(bucket.consume(250), .25)
+        # capacity보다 큰 청크도 된다.
+        self.assertEqual(bucket.consume(2000), 2)
+        clock.now += 10
+        self.assertEqual(bucket.consume(500), 0)
+        self.assertEqual(bucket.consume(100), .1)
+        self.assertEqual((bucket.consumed, bucket.waited), (3350, 2.35))
+
+    def test_achieved_rate(self):
+        clock = FakeClock()
+        bucket = clock.bucket(rate=100 * 1000)
+        for _ in range(1000):
+            bucket.consume(1000)
+        # 처음 1초치(capacity)를 빼면 정확히 rate
+        self.assertAlmostEqual(clock.now, (1000 * 1000 - 100 * 1000) / (100 * 1000))
+
+    def test_shared_by_threads(self):
+        # 시계가 안 가면 마지막으로 가져간 쪽이 빚 전부를 기다린다. (순서와 상관없이)
+        clock = FakeClock(advance=False)
+        bucket = clock.bucket(rate=100, capacity=100)
+        waits = []
+
+        def download():
+            for _ in range(250):
+                waits.append(bucket.consume(10))
+
+        threads = [threading.Thread(target=download) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(bucket.consumed, 10000)
+        self.assertAlmostEqual(max(waits), (10000 - 100) / 100)
+        self.assertEqual(sorted(waits)[:10], [0] * 10)
+
+    def test_asyncio(self):
+        clock = FakeClock()
+        bucket = clock.bucket(rate=1000, capacity=1000)
+        statuses = [DownloadStatus(limiter=bucket) for _ in range(3)]
+
+        async def download(status):
+            status.started()
+            for _ in range(10):
+                await status.throttle_async(100)
+                status.chunk_downloaded(100)
+                await asyncio.sleep(0)
+            status.finished()
+
+        async def main():
+            await asyncio.gather(*(download(status) for status in statuses))
+
+        asyncio.run(main())
+        self.assertAlmostEqual(clock.now, 2)
+        self.assertAlmostEqual(sum(status.time_throttled for status in statuses), bucket.waited)
+        self.assertEqual(sum(status.downloaded for status in statuses), 3000)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(0)
+
+    def test_reporter_shows_limit(self):
+        clock = FakeClock()
+        status = DownloadStatus(limiter=clock.bucket(rate=1000))
+        status.started(total_size=10 * 1000)
+        output = io.StringIO()
+        reporter = ProgressReporterThread(status, output, estimator=SlidingWindowRateEstimator())
+        with mock.patch('httpie_downloads.time', side_effect=[100.0, 102.0]):
+            reporter.report_speed()
+            for _ in range(3):
+                status.throttle(1000)
+                status.chunk_downloaded(1000)
+            reporter.report_speed()
+        self.assertEqual(status.time_throttled, 2)
+        self.assertIn('1.46 kB/s', output.getvalue())
+        self.assertIn('(limit 1000.00 B/s, waited 2.0s)', output.getvalue())
+
+    def test_no_limiter(self):
+        status = ShardedDownloadStatus()
+        status.throttle(10 ** 9)
+        self.assertEqual(status.time_throttled, 0)
+
+
+class TestSegmentedDownloader(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RangeHandler)
+        self.server.data = os.urandom(100 * 1000 + 7)
+        self.server.accept_ranges = True
+        self.server.fail_ranges = set()
+        self.server.etag = '"v1"'
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/file.bin'
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'file.bin')
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download_in_segments(self):
+        calls = []
+        status = DownloadStatus()
+        status.add_listener(lambda s: calls.append(s.downloaded))
+        downloader = SegmentedDownloader(self.url, self.path, status, segment_size=10000,
+                                         connections=4)
+        downloader.download()
+        self.assertEqual(self.read(), self.server.data)
+        self.assertEqual(sorted(self.server.requests), list(range(0, 100 * 1000 + 7, 10000)))
+        self.assertEqual(status.downloaded, len(self.server.data))
+        self.assertEqual(status.total_size, len(self.server.data))
+        self.assertTrue(status.has_finished)
+        self.assertEqual(calls[-1], len(self.server.data))
+        self.assertFalse(os.path.exists(downloader.journal_path))
+
+    def test_resume(self):
+        self.server.fail_ranges = {30000}
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=10000, connections=2)
+        with self.assertRaises(ContentRangeError):
+            downloader.download()
+        self.assertTrue(os.path.exists(downloader.journal_path))
+
+        self.server.requests.clear()
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=10000, connections=2)
+        status = downloader.download(resume=True)
+        self.assertEqual(self.read(), self.server.data)
+        # 실패한 범위(와 실패 때문에 못 받은 범위)만 다시 받는다.
+        self.assertIn(30000, self.server.requests)
+        self.assertLess(len(self.server.requests), 11)
+        size = len(self.server.data)
+        refetched = sum(min(start + 10000, size) - start for start in self.server.requests)
+        self.assertEqual(status.resumed_from, size - refetched)
+        self.assertEqual(status.downloaded, size)
+
+    def fail_first_run(self, segment_size=10000):
+        self.server.fail_ranges = {30000}
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=segment_size,
+                                         connections=1)
+        with self.assertRaises(ContentRangeError):
+            downloader.download()
+        self.server.requests.clear()
+
+    def test_resume_with_different_segment_size(self):
+        self.fail_first_run(segment_size=10000)
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=50000)
+        status = downloader.download(resume=True)
+        self.assertEqual(self.read(), self.server.data)
+        self.assertEqual(status.resumed_from, 0)
+        self.assertEqual(sorted(self.server.requests), [0, 50000, 100000])
+
+    def test_resume_after_server_change(self):
+        self.fail_first_run()
+        # 크기는 같고 내용만 바뀜
+        self.server.data = os.urandom(len(self.server.data))
+        self.server.etag = '"v2"'
+        status = SegmentedDownloader(self.url, self.path, segment_size=10000).download(resume=True)
+        self.assertEqual(self.read(), self.server.data)
+        self.assertEqual(status.resumed_from, 0)
+
+    def test_no_resume_without_validator(self):
+        self.server.etag = None
+        self.fail_first_run()
+        status = SegmentedDownloader(self.url, self.path, segment_size=10000).download(resume=True)
+        self.assertEqual(self.read(), self.server.data)
+        self.assertEqual(status.resumed_from, 0)
+
+    def test_changed_while_downloading(self):
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=10000)
+        probe = downloader._probe
+
+        def changed_after_probe():
+            result = probe()
+            self.server.etag = '"v2"'
+            return result
+        downloader._probe = changed_after_probe
+        with self.assertRaisesRegex(ContentRangeError, 'changed on the server'):
+            downloader.download()
+        # 남은 범위마다 파일 전체(200)를 받아서 버리지 않는다. (범위 11개)
+        self.assertLess(len(self.server.requests), 6)
+
+    def test_stops_after_first_failure(self):
+        # 범위 21개 중 처음 것이 실패하면 나머지는 요청하지 않는다.
+        self.server.fail_ranges = {0}
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=5000, connections=2)
+        with self.assertRaisesRegex(ContentRangeError, 'Unexpected status 500'):
+            downloader.download()
+        # 실패한 범위와, 그동안 다른 커넥션이 시작했던 범위 몇 개만 (안 멈추면 21개)
+        self.assertLess(len(self.server.requests), 10)
+        self.assertTrue(os.path.exists(downloader.journal_path))
+
+        self.server.requests.clear()
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=5000, connections=2)
+        status = downloader.download(resume=True)
+        self.assertEqual(self.read(), self.server.data)
+        self.assertIn(0, self.server.requests)
+        self.assertEqual(status.downloaded, len(self.server.data))
+
+    def test_limited(self):
+        bucket = TokenBucket(rate=10 ** 9)
+        status = ShardedDownloadStatus(limiter=bucket)
+        SegmentedDownloader(self.url, self.path, status, segment_size=10000).download()
+        self.assertEqual(self.read(), self.server.data)
+        self.assertEqual(bucket.consumed, len(self.server.data))
+
+    def test_without_range_support(self):
+        self.server.accept_ranges = False
+        downloader = SegmentedDownloader(self.url, self.path, segment_size=10000)
+        status = downloader.download(resume=True)
+        self.assertEqual(self.read(), self.server.data)
+        self.assertEqual(self.server.requests, [None])
+        self.assertEqual(status.resumed_from, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -116,9 +116,9 @@ class ShorthandParser(object):
         elif self._current() == '[':
             return self._explicit_list()
         elif self._current() == '{':
-            return self._hash_literal
+            return self._hash_literal()
         else:
-            return self._csv_value()
+            return self._csv_list()
 
     def _csv_list(self):
         first_value = self._first_value()
@@ -17,19 +17,156 @@
 #
 #
 
+import mmap
+import os
 import re
 import string
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 
 _EOF = object()   # object()는 모든 클래스의 기반이 되는 기능이 없는 객체를 반환함
 
+# functools.lru_cache의 cache_info()와 같은 모양
+_CacheInfo = namedtuple('_CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+# ShorthandParseError.details()의 반환값
+_ErrorDetails = namedtuple('_ErrorDetails', ['index', 'expected', 'actual'])
+# parse_file()이 yield 하는 값. offset / end는 그 줄의 시작 / 다음 줄의 시작 byte 위치
+_FileLine = namedtuple('_FileLine', ['lineno', 'offset', 'end', 'result', 'error'])
+
+
+def _copy_parsed(value):
+    # 파싱 결과는 dict / list / str 뿐이라 copy.deepcopy보다 직접 복사하는게 훨씬 빠르다.
+    # str은 불변이라 그대로 공유해도 됨
+    if isinstance(value, dict):
+        return {key: _copy_parsed(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [_copy_parsed(val) for val in value]
+    return value
+
+
+def _compact(value):
+    # compact=True용. 문자열은 intern 해서 같은 값끼리 한 객체를 공유하고
+    # list는 tuple, dict는 FrozenMapping으로 바꾼다.
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple([_compact(val) for val in value])
+    if isinstance(value, dict):
+        return FrozenMapping._from_items(
+            [(sys.intern(key), _compact(val)) for key, val in value.items()])
+    return value
+
+
+def _profiled(method, counter):
+    # profile=True용. counter는 [호출 횟수, 걸린 시간(초)] 리스트
+    perf_counter = time.perf_counter
+
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            counter[0] += 1
+            counter[1] += perf_counter() - start
+    return wrapper
+
+
+class _CountingRegex(object):
+    # profile=True용. _NamedRegex 대신 끼워서 match() 횟수를 센다.
+    def __init__(self, named_regex, counter):
+        self.name = named_regex.name
+        self.regex = named_regex.regex
+        self._counter = counter
+
+    def match(self, value, pos=0):
+        self._counter[0] += 1
+        return self.regex.match(value, pos)
+
+
+class _Shape(object):
+    # FrozenMapping끼리 공유하는 key 목록과 key -> 위치 인덱스
+    __slots__ = ('keys', 'index', '__weakref__')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = {key: i for i, key in enumerate(keys)}
+
+
+class FrozenMapping(Mapping):
+    """
+    compact=True로 파싱했을 때 dict 대신 나오는 읽기 전용 mapping.
+    example:
+        parser = ShorthandParser(compact=True)
+        parser.parse('Name=foo,Values=a,b')
+        # FrozenMapping({'Name': 'foo', 'Values': ('a', 'b')})
+    key 구성(순서 포함)이 같은 결과끼리는 key 튜플과 인덱스(_Shape)를 공유하고
+    각자는 값 튜플 하나만 들고 있다. (CPython의 key-sharing dict와 같은 생각)
+    같은 모양의 결과를 수백만 개 들고 있을 때 dict보다 메모리를 훨씬 덜 쓴다.
+    값이 전부 불변이라 hash 할 수 있고, dict와 == 비교도 된다.
+    """
+    __slots__ = ('_shape', '_values')
+
+    # key 튜플 -> _Shape. 쓰는 FrozenMapping이 없어지면 같이 사라진다.
+    _shapes = weakref.WeakValueDictionary()
+
+    def __init__(self, items=()):
+        if isinstance(items, Mapping):
+            items = items.items()
+        items = [(sys.intern(key), value) for key, value in dict(items).items()]
+        self._init(items)
+
+    @classmethod
+    def _from_items(cls, items):
+        # _compact()용. key가 이미 intern 되어있고 중복도 없다.
+        self = cls.__new__(cls)
+        self._init(items)
+        return self
+
+    def _init(self, items):
+        keys = tuple([key for key, _ in items])
+        shape = self._shapes.get(keys)
+        if shape is None:
+            shape = self._shapes.setdefault(keys, _Shape(keys))
+        self._shape = shape
+        self._values = tuple([value for _, value in items])
+
+    def __getitem__(self, key):
+        return self._values[self._shape.index[key]]
+
+    def __contains__(self, key):
+        return key in self._shape.index
+
+    def __iter__(self):
+        return iter(self._shape.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __hash__(self):
+        return hash(frozenset(zip(self._shape.keys, self._values)))
+
+    def __reduce__(self):
+        # 받는 쪽 프로세스에서 다시 intern 하고 _Shape을 찾도록 items로 넘긴다.
+        return FrozenMapping, (tuple(zip(self._shape.keys, self._values)),)
+
+    def __repr__(self):
+        return 'FrozenMapping(%r)' % (dict(zip(self._shape.keys, self._values)),)
+
 
 class _NamedRegex(object):
     def __init__(self, name, regex_str):
         self.name = name
         self.regex = re.compile(regex_str, re.UNICODE)
 
-    def match(self, value):
-        return self.regex.match(value)
+    def match(self, value, pos=0):
+        # value[pos:]로 잘라서 넘기면 매번 남은 문자열 전체가 복사된다.
+        # match(string, pos)는 복사 없이 pos부터 매치함
+        return self.regex.match(value, pos)
 
 
 class ShorthandParser(object):
@@ -60,9 +197,117 @@ class ShorthandParser(object):
             start_word=_START_WORD,
             follow_chars=_SECOND_FOLLOW_CHARS,
         ))
+    # fast path용 테이블. 매 호출마다 다시 만들지 않도록 클래스 정의 시점에 한번만 만든다.
+    # string.whitespace와 같은 문자만 공백으로 취급해야 하므로 \s 대신 문자를 직접 나열함
+    _WHITESPACE_CHARS = frozenset(string.whitespace)
+    _KEY_CHARS = frozenset(string.ascii_letters + string.digits + '-_.#/:')
+    _FAST_WS = r'[ \t\n\r\x0b\x0c]*'
+    # 따옴표와 이스케이프가 없으면 ','는 항상 구분자이다. (값 정규식이 ','를 허용하지 않음)
+    # 그래서 ','로 한번에 자른 뒤 조각마다 정규식 하나로 전체 매치만 확인하면 된다.
+    # key "=" [first-value]
+    _FAST_KEYVAL = re.compile(
+        u'{ws}([a-zA-Z0-9\\-_.#/:]*){ws}={ws}([{start_word}][{follow_chars}]*)?'.format(
+            start_word=_START_WORD, follow_chars=_FIRST_FOLLOW_CHARS,
+            ws=_FAST_WS))
+    # second-value. '='를 허용하지 않으므로 keyval 조각과 절대 겹치지 않는다.
+    _FAST_SECOND_VALUE = re.compile(
+        u'{ws}([{start_word}][{follow_chars}]*)'.format(
+            start_word=_START_WORD, follow_chars=_SECOND_FOLLOW_CHARS,
+            ws=_FAST_WS))
+    # 스키마 파서(SchemaShorthandParser)에서 key -> 변환 함수 dict로 채운다.
+    _fields = None
+    # 이 문자가 하나라도 있으면 fast path를 포기한다.
+    _FAST_BAIL_CHARS = ('\'', '"', '\\')
+    # parse_stream()에서 keyval 경계를 찾을 때 쓰는 테이블
+    _STREAM_SPECIAL = re.compile(r'[\'"\\,\[\]{}]')
+    _STREAM_QUOTE_END = {
+        "'": re.compile(r"[\\']"),
+        '"': re.compile(r'[\\"]'),
+    }
+    _STREAM_NEXT_KEY = re.compile(_FAST_WS + r'[a-zA-Z0-9\-_.#/:]*' + _FAST_WS)
+    # profile=True일 때 호출 횟수와 시간을 재는 메서드 (문법 규칙별)
+    _PROFILED_METHODS = ('_keyval', '_csv_value', '_explicit_list', '_hash_literal',
+                         '_consume_quoted', '_backtrack_to')
+    # profile=True일 때 match() 횟수를 세는 정규식
+    _PROFILED_REGEXES = ('_FIRST_VALUE', '_SECOND_VALUE', '_SINGLE_QUOTED', '_DOUBLE_QUOTED')
 
-    def __init__(self):
+    def __init__(self, cache_size=128, compact=False, profile=False):
+        """
+        파서 객체에는 설정(스키마, compact)과 캐시만 있고 파싱 위치(_input_value, _index)는
+        호출마다 _begin()으로 만든 복사본이 따로 가진다.
+        그래서 모듈 전역 파서 하나를 여러 스레드에서 동시에 써도 되고,
+        parse_stream() 도중에 같은 파서로 parse()를 불러도 된다.
+        """
         self._tokens = []
+        # True면 결과를 _compact()로 바꿔서 반환. (intern된 문자열, tuple, FrozenMapping)
+        self._compact = compact
+        # parse_cached()용 LRU 캐시. OrderedDict의 뒤쪽이 가장 최근에 쓴 항목이다.
+        # 여러 스레드가 같이 쓰므로 캐시를 만질 때는 _cache_lock을 잡는다. (파싱 자체는 락 밖에서)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_size = cache_size
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # profile_stats()용. 끄면 None이고 파싱 경로에 아무것도 끼우지 않는다.
+        self._profile = None
+        if profile:
+            self._profile = {}
+            self.profile_clear()
+
+    def _begin(self, value):
+        # 이번 호출만 쓰는 얕은 복사본. 설정과 캐시는 공유하고 파싱 위치만 따로 가진다.
+        # 클래스를 그대로 쓰므로 SchemaShorthandParser._keyval() 같은 오버라이드도 그대로 동작함
+        # __dict__.update()로 한번에 복사하면 CPython 3.11+에서 속성 읽기/쓰기가 느린 경로로 빠진다.
+        # (인스턴스끼리 key를 공유하는 dict가 아니게 됨) 파싱 중에 _index를 글자마다 만지므로
+        # __init__이 만든 순서대로 하나씩 setattr 한다.
+        state = object.__new__(self.__class__)
+        for name, attr in self.__dict__.items():
+            setattr(state, name, attr)
+        state._input_value = value
+        state._index = 0
+        if self._profile is not None:
+            # 복사본의 인스턴스 속성으로 감싼 메서드를 끼운다. (클래스 메서드보다 먼저 찾아짐)
+            for name in self._PROFILED_METHODS:
+                setattr(state, name, _profiled(getattr(state, name), self._profile[name]))
+        return state
+
+    def profile_stats(self):
+        """
+        profile=True로 만든 파서의 문법 규칙별 통계.
+        example:
+            parser = ShorthandParser(profile=True)
+            for line in lines:
+                parser.parse(line)
+            parser.profile_stats()
+            # {'_parse_fast': {'calls': 1000, 'time': 0.004}, '_keyval': {...}, ...,
+            #  'backtracks': 120, 'regex': {'_FIRST_VALUE': 2100, ...}}
+        time은 안에서 부른 규칙 시간까지 포함한 초 단위. (_keyval 시간에 _csv_value 시간이 들어있음)
+        _parse_fast는 fast path를 시도한 횟수이고, 나머지는 재귀 하강 파서로 넘어간 입력만 센다.
+        parse_parallel()의 워커 프로세스는 세지 않음.
+        여러 스레드에서 같이 쓰면 숫자가 조금 빠질 수 있다. (락을 안 잡음)
+        :return: dict. profile=False면 None
+        """
+        if self._profile is None:
+            return None
+        stats = {}
+        for name in ('_parse_fast',) + self._PROFILED_METHODS:
+            calls, elapsed = self._profile[name]
+            stats[name] = {'calls': calls, 'time': elapsed}
+        stats['backtracks'] = self._profile['_backtrack_to'][0]
+        stats['regex'] = {name: self._profile[name][0] for name in self._PROFILED_REGEXES}
+        return stats
+
+    def profile_clear(self):
+        if self._profile is None:
+            return
+        for name in ('_parse_fast',) + self._PROFILED_METHODS + self._PROFILED_REGEXES:
+            self._profile[name] = [0, 0.0]
+        # fast path는 인스턴스 상태를 안 쓰므로 self에 한번만 끼우면 되고,
+        # 정규식도 self에 끼워두면 _begin()의 복사본이 같이 가져간다.
+        self._parse_fast = _profiled(
+            self.__class__._parse_fast.__get__(self), self._profile['_parse_fast'])
+        for name in self._PROFILED_REGEXES:
+            setattr(self, name, _CountingRegex(getattr(self.__class__, name), self._profile[name]))
 
     def parse(self, value):
         """
@@ -71,13 +316,352 @@ class ShorthandParser(object):
             parser = ShorthandParser()
             parser.parse('a=b')    # {'a': 'b'}
             parser.parse('a=b,c')  # {'a': ['b', 'c']}
+        compact=True로 만든 파서는 dict 대신 FrozenMapping, list 대신 tuple을 반환한다.
         :type value: str
         :param value: 파싱할 수 있는 아무 값
         :return: dictionary 형태의 파싱된 값
         """
-        self._input_value = value
-        self._index = 0
-        return self._parameter()
+        result = self._parse(value)
+        if self._compact:
+            return _compact(result)
+        return result
+
+    def _parse(self, value):
+        # fast path는 인스턴스 상태를 안 쓰므로 복사본이 필요 없다.
+        result = self._parse_fast(value)
+        if result is None:
+            result = self._begin(value)._parameter()
+        return result
+
+    def parse_cached(self, value):
+        """
+        parse()와 같지만 입력 문자열별로 결과를 캐시해둔다.
+        같은 문자열(예: 'Name=foo,Values=a,b')을 계속 파싱하는 CLI용.
+        캐시가 cache_size를 넘으면 가장 오래 안 쓴 항목부터 버린다. (LRU)
+
+        캐시에 든 결과를 그대로 주면 호출한 쪽에서 고쳤을 때 캐시가 오염되므로
+        항상 복사본을 반환한다. (compact=True면 결과가 불변이라 복사하지 않음)
+        파싱 에러는 캐시하지 않음.
+        :type value: str
+        :param value: 파싱할 수 있는 아무 값
+        :return: dictionary 형태의 파싱된 값 (복사본)
+        """
+        cache = self._cache
+        with self._cache_lock:
+            result = cache.get(value, _EOF)
+            if result is _EOF:
+                self._cache_misses += 1
+            else:
+                self._cache_hits += 1
+                cache.move_to_end(value)
+        if result is _EOF:
+            result = self.parse(value)
+            if self._cache_size > 0:
+                with self._cache_lock:
+                    cache[value] = result
+                    if len(cache) > self._cache_size:
+                        cache.popitem(last=False)
+        if self._compact:
+            return result
+        return _copy_parsed(result)
+
+    def cache_info(self):
+        """parse_cached() 캐시의 hits, misses, maxsize, currsize"""
+        return _CacheInfo(self._cache_hits, self._cache_misses,
+                          self._cache_size, len(self._cache))
+
+    def cache_clear(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_hits = self._cache_misses = 0
+
+    def parse_stream(self, chunks):
+        """
+        입력 전체를 메모리에 올리지 않고 청크 단위로 받아서
+        keyval 하나가 끝날 때마다 (key, value)를 yield 한다.
+        example:
+            with open('manifest.txt') as f:
+                for key, value in parser.parse_stream(iter(lambda: f.read(65536), '')):
+                    ...
+        따옴표/중첩 리스트/해시 밖에 있는 ',' 뒤에 'key='가 오면 keyval 경계일 가능성이 높다.
+        (_csv_value()가 백트랙킹하는 바로 그 콤마) 그런 후보를 만날 때만 버퍼 맨 앞의 keyval을
+        기존 파서로 파싱해보고, 버퍼 끝에 닿기 전에 끝났으면 확정해서 내보낸다.
+        그래서 결과는 parse()와 같고, 메모리는 가장 큰 keyval 하나 + 청크 하나 크기 정도로 제한된다.
+
+        주의: 잘못된 입력이면 입력이 끝날 때 에러를 낸다.
+        에러의 value와 index는 전체 입력이 아니라 에러가 난 keyval이 들어있는 버퍼 기준이다.
+        :type chunks: iterable of str
+        :param chunks: 파일 객체, 제너레이터 등 문자열 청크를 돌려주는 아무 iterable
+        :return: (key, value) 튜플 제너레이터
+        """
+        state = self._begin('')
+        seen = set()
+        buffer = ''
+        start = 0       # buffer에서 아직 확정되지 않은 부분의 시작
+        first = True
+        pos = 0
+        depth = 0
+        quote = None
+        chunks = iter(chunks)
+        final = False
+        while not final:
+            chunk = next(chunks, None)
+            if chunk is None:
+                final = True
+            else:
+                # 확정된 앞부분은 청크를 받을 때 한번에 버린다.
+                buffer = buffer[start:] + chunk
+                pos -= start
+                start = 0
+            while True:
+                if quote is not None:
+                    match = self._STREAM_QUOTE_END[quote].search(buffer, pos)
+                    if match is None:
+                        pos = len(buffer)
+                        break
+                    i = match.start()
+                    if buffer[i] == quote:
+                        quote = None
+                        pos = i + 1
+                    elif i + 1 < len(buffer):
+                        # \\ 나 \' 같은 이스케이프는 두 글자를 같이 건너뛴다.
+                        pos = i + 2
+                    else:
+                        pos = i
+                        break
+                    continue
+                match = self._STREAM_SPECIAL.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    break
+                i = match.start()
+                char = buffer[i]
+                pos = i + 1
+                if char in '\'"':
+                    quote = char
+                elif char == '\\':
+                    if buffer[i + 1:i + 2] == ',':
+                        # 이스케이프된 콤마는 값의 일부
+                        pos = i + 2
+                elif char in '[{':
+                    # '['와 '{'는 값이 시작하는 자리에서만 리스트/해시가 된다.
+                    # 값 중간의 a[b 같은 건 그냥 문자임
+                    before = self._char_before(buffer, i)
+                    if before == '=' or (depth and before in ',['):
+                        depth += 1
+                elif char in ']}':
+                    if depth:
+                        depth -= 1
+                elif not depth and i != start:
+                    # foo=a,b,c=d
+                    #        ^-최상위 ',' 뒤에 key= 가 오면 경계 후보
+                    # (start 자리의 콤마는 지금 keyval 앞의 구분자라서 후보가 아님)
+                    end = self._STREAM_NEXT_KEY.match(buffer, pos).end()
+                    if end == len(buffer) and not final:
+                        # key가 청크 경계에 걸쳐있으면 다음 청크를 기다린다.
+                        pos = i
+                        break
+                    if buffer[end:end + 1] != '=':
+                        continue
+                    result = state._stream_keyval(buffer, start, first, i)
+                    if result is None:
+                        continue
+                    key, value, end = result
+                    if key in seen:
+                        raise DuplicateKeyInObjectError(key, buffer, start + 1)
+                    seen.add(key)
+                    yield key, value
+                    # 확정된 keyval 바로 뒤부터 다시 훑는다.
+                    start = pos = end
+                    first = False
+                    depth = 0
+        while start < len(buffer) or first:
+            # 입력이 끝났으므로 남은 keyval은 전부 확정이다.
+            key, value, end = state._stream_keyval(buffer, start, first, None)
+            if key in seen:
+                raise DuplicateKeyInObjectError(key, buffer, start + 1)
+            seen.add(key)
+            yield key, value
+            start = end
+            first = False
+
+    def _stream_keyval(self, buffer, start, first, limit):
+        """
+        buffer의 start 위치에 있는 keyval 하나를 기존 파서로 파싱해서 (key, value, 끝난 위치)를 반환한다.
+        limit은 경계 후보 콤마의 위치. keyval이 그 콤마를 넘어가면 후보가 틀렸거나
+        다음 청크에 따라 결과가 달라질 수 있으므로 None. (limit이 None이면 입력의 끝)
+        """
+        self._input_value = buffer
+        self._index = start
+        try:
+            # parameter = keyval *("," keyval)
+            if not first:
+                self._expect(',', consume_whitespace=True)
+            key, value = self._keyval()
+        except ShorthandParseError:
+            if limit is None:
+                raise
+            return None
+        if limit is not None and self._index > limit:
+            return None
+        if self._compact:
+            return sys.intern(key), _compact(value), self._index
+        return key, value, self._index
+
+    def parse_parallel(self, value, workers=None, chunk_size=65536, executor=None):
+        """
+        최상위 keyval이 수만 개인 긴 문자열 하나를 여러 프로세스에서 나눠 파싱한다.
+        example:
+            with ProcessPoolExecutor() as executor:
+                result = parser.parse_parallel(huge_value, executor=executor)
+        따옴표/리스트/해시 밖에 있고 뒤에 'key='가 오는 ','에서 chunk_size 정도마다 자르고
+        조각마다 워커에서 파싱한 다음 순서대로 합친다. 결과는 parse()와 같다.
+
+        조각은 다음 'key='까지 같이 넘겨서 기존 파서가 보는 것과 똑같이 lookahead 하게 하고,
+        keyval이 자른 콤마를 넘어가면 잘못 자른 것으로 본다.
+        파싱 에러, 잘못 자른 경우, 합치다가 중복 key가 나온 경우에는 전체를 parse()로 다시 파싱한다.
+        그래서 에러(DuplicateKeyInObjectError의 index 포함)도 parse()와 똑같음.
+        SchemaShorthandParser나 chunk_size보다 짧은 입력은 그냥 parse() 한다.
+        :type value: str
+        :param value: 파싱할 수 있는 아무 값
+        :param workers: 프로세스 수. None이면 CPU 개수 (executor를 넘기면 무시)
+        :param chunk_size: 조각 하나의 대략적인 길이
+        :param executor: 재사용할 concurrent.futures executor. None이면 호출할 때마다 만든다.
+        :return: dictionary 형태의 파싱된 값
+        """
+        if self._fields is not None:
+            return self.parse(value)
+        points = self._split_points(value, chunk_size)
+        if not points:
+            return self.parse(value)
+        texts, firsts, limits = [], [], []
+        start = 0
+        for comma, lookahead_end in points:
+            texts.append(value[start:lookahead_end])
+            firsts.append(start == 0)
+            limits.append(comma - start)
+            start = comma
+        texts.append(value[start:])
+        firsts.append(False)
+        limits.append(None)
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+                segments = list(executor.map(_parse_segment, texts, firsts, limits))
+        else:
+            segments = list(executor.map(_parse_segment, texts, firsts, limits))
+        params = {}
+        for keyvals in segments:
+            if keyvals is None:
+                return self.parse(value)
+            for key, val in keyvals:
+                if key in params:
+                    return self.parse(value)
+                params[key] = val
+        if self._compact:
+            return _compact(params)
+        return params
+
+    def _split_points(self, value, chunk_size):
+        """
+        parse_stream()처럼 따옴표와 중첩을 따라가면서 chunk_size마다 그 뒤에 처음 나오는
+        경계 후보 콤마를 고른다.
+        :return: [(콤마 위치, 다음 key 뒤 '='의 다음 위치), ...]
+        """
+        points = []
+        target = chunk_size
+        pos = 0
+        depth = 0
+        while True:
+            match = self._STREAM_SPECIAL.search(value, pos)
+            if match is None:
+                return points
+            i = match.start()
+            char = value[i]
+            pos = i + 1
+            if char in '\'"':
+                quote_end = self._STREAM_QUOTE_END[char]
+                while True:
+                    match = quote_end.search(value, pos)
+                    if match is None:
+                        # 따옴표가 안 닫혔으면 더 자를 곳이 없다. (에러는 파서가 냄)
+                        return points
+                    pos = match.end()
+                    if value[match.start()] == char:
+                        break
+                    pos += 1
+            elif char == '\\':
+                if value[i + 1:i + 2] == ',':
+                    pos = i + 2
+            elif char in '[{':
+                before = self._char_before(value, i)
+                if before == '=' or (depth and before in ',['):
+                    depth += 1
+            elif char in ']}':
+                if depth:
+                    depth -= 1
+            elif not depth and i >= target:
+                end = self._STREAM_NEXT_KEY.match(value, pos).end()
+                if value[end:end + 1] == '=':
+                    points.append((i, end + 1))
+                    target = i + chunk_size
+
+    def _char_before(self, buffer, index):
+        # index 앞에서 공백이 아닌 마지막 문자
+        index -= 1
+        while index >= 0 and buffer[index] in self._WHITESPACE_CHARS:
+            index -= 1
+        return buffer[index] if index >= 0 else ''
+
+    def _parse_fast(self, value):
+        """
+        따옴표와 이스케이프가 없는 입력(key=val,...)을 미리 컴파일한 정규식 테이블로
+        한번에 훑으면서 파싱한다.
+        문자 하나씩 메서드를 부르지 않고 ','로 나눈 조각마다 fullmatch 한번만 한다.
+
+        결과는 _parameter()와 똑같아야 하므로 조금이라도 애매하면(에러, 중복 키,
+        중첩 리스트/해시 등) None을 반환하고 기존 재귀 하강 파서에 맡긴다.
+        그래서 에러 메시지와 index도 항상 기존과 같음.
+        """
+        for char in self._FAST_BAIL_CHARS:
+            if char in value:
+                return None
+        keyval = self._FAST_KEYVAL.fullmatch
+        second_value = self._FAST_SECOND_VALUE.fullmatch
+        pieces = value.split(',')
+        if pieces[0][:1] in self._WHITESPACE_CHARS:
+            # 맨 앞의 공백은 기존 파서에서 에러다. ('' in frozenset도 False라 안전)
+            return None
+        fields = self._fields
+        keyvals = []
+        csv_list = None
+        for piece in pieces:
+            match = second_value(piece)
+            if match is not None and csv_list is not None:
+                # foo=a,b
+                #       ^-여기
+                csv_list.append(match.group(1).rstrip())
+                continue
+            match = keyval(piece)
+            if match is None:
+                return None
+            key, val = match.groups()
+            if fields is not None and key not in fields:
+                # 스키마에 없는 key는 값을 읽기 전에 바로 포기 (에러는 기존 파서가 냄)
+                return None
+            csv_list = ['' if val is None else val.rstrip()]
+            keyvals.append((key, csv_list))
+        params = {}
+        for key, csv_list in keyvals:
+            if key in params:
+                return None
+            val = csv_list if len(csv_list) > 1 else csv_list[0]
+            if fields is not None:
+                try:
+                    val = fields[key](val)
+                except _SchemaMismatch:
+                    return None
+            params[key] = val
+        return params
 
     def _parameter(self):
         # parameter = keyval *("," keyval)
@@ -120,7 +704,7 @@ class ShorthandParser(object):
 
     def _key(self):
         # key = 1*(alpha / %x30-39 / %x5f / %x2e / %x23)    ; [a-zA-Z0-9\-_.#/]
-        valid_chars = string.ascii_letters + string.digits + '-_.#/:'
+        valid_chars = self._KEY_CHARS
         start = self._index
         while not self._at_eof():
             if self._current() not in valid_chars:
@@ -157,27 +741,32 @@ class ShorthandParser(object):
         #     ^-여기
         # 위의 상황이면 ShorhandParser를 부르고, 콤마로 돌아가서 단일 스칼라인 'b'값을 반환한다.
         while True:
-            try:
-                current = self._second_value()
+            # 다음 값을 한 토큰만 미리 읽어보고(lookahead) 그 뒤에 ','나 EOF가 오는지 본다.
+            # 예전에는 _second_value()가 에러를 내면 잡아서 되돌아갔는데
+            # 에러 객체와 메시지를 매번 만드는 비용이 커서 예외 없이 판단한다.
+            if self._at_eof():
+                # foo=a,
+                #       ^-콤마 뒤에 값이 없으면 에러
+                self._must_consume_regex(self._SECOND_VALUE)
+            current = self._second_value(required=False)
+            if current is not None:
                 self._consume_whitespace()
                 if self._at_eof():
                     csv_list.append(current)
                     break
-                self._expect(',', consume_whitespace=True)
-                csv_list.append(current)
-            except ShorthandParseSyntaxError:
-                # 이전 콤마를 다시 트랙킹한다.
-                # 요런 상황이 나올 수 있음
-                # foo=a,b,c=d,e=f
-                #     ^-시작
-                # foo=a,b,c=d,e=f
-                #          ^-에러, "expected ',' received '='
-                # foo=a,b,c=d,e=f
-                #        ^-요기를 다시 백트랙킹
-                if self._at_eof():
-                    raise
-                self._backtrack_to(',')
-                break
+                if self._input_value[self._index] == ',':
+                    self._expect(',', consume_whitespace=True)
+                    csv_list.append(current)
+                    continue
+            # 값이 아니거나 값 뒤에 ','가 아닌 게 오면 이전 콤마로 돌아간다.
+            # foo=a,b,c=d,e=f
+            #     ^-시작
+            # foo=a,b,c=d,e=f
+            #          ^-'='를 봤으므로 다음 keyval의 key였다.
+            # foo=a,b,c=d,e=f
+            #        ^-요기로 백트랙킹
+            self._backtrack_to(',')
+            break
         if len(csv_list) == 1:
             # 요것은 foo=bar 케이스이므로 스칼라 값 'bar', 즉 {"bar":["bar"]} 대신 {"foo":"bar"}로 해야함
             return first_value
@@ -193,7 +782,7 @@ class ShorthandParser(object):
         return _EOF
 
     def _value(self):
-        result = self._FIRST_VALUE.match(self._input_value[self._index:])
+        result = self._FIRST_VALUE.match(self._input_value, self._index)
         if result is not None:
             consumed = self._consume_matched_regex(result)
             return consumed.replace('\\,', ',').rstrip()    # rstrip(): 오른쪽 공백 제거
@@ -220,7 +809,7 @@ class ShorthandParser(object):
         elif self._current() == '{':
             return self._hash_literal()
         else:
-            return self._first_values()
+            return self._first_value()
 
     def _hash_literal(self):
         self._expect('{', consume_whitespace=True)
@@ -250,8 +839,11 @@ class ShorthandParser(object):
         # val-escaped-single = %x20-26 / %x28-7F / escaped-escape / (escape single-quote)
         return self._consume_quoted(self._SINGLE_QUOTED, escaped_char="'")
 
-    def _consume_quoted(self, regex, escaped_char=None):
-        value = self._must_consume_regex(regex)[1:-1]
+    def _consume_quoted(self, regex, escaped_char=None, required=True):
+        value = self._consume_regex(regex, required)
+        if value is None:
+            return None
+        value = value[1:-1]
         if escaped_char is not None:
             value = value.replace("\\%s" % escaped_char, escaped_char)
             value = value.replace("\\\\", "\\")
@@ -260,37 +852,312 @@ class ShorthandParser(object):
     def _double_quoted_value(self):
         return self._consume_quoted(self._DOUBLE_QUOTED, escaped_char='"')
 
-    def _second_value(self):
+    def _second_value(self, required=True):
+        # required가 False면 매치가 안 될 때 에러 대신 None을 반환 (lookahead용)
         if self._current() == "'":
-            return self._single_quoted_value()
+            return self._consume_quoted(self._SINGLE_QUOTED, "'", required)
         elif self._current() == '"':
-            return self._double_quoted_value()
+            return self._consume_quoted(self._DOUBLE_QUOTED, '"', required)
         else:
-            consumed = self._must_consume_regex(self._SECOND_VALUE)
+            consumed = self._consume_regex(self._SECOND_VALUE, required)
+            if consumed is None:
+                return None
             return consumed.replace('\\,', ',').rstrip()
 
     def _must_consume_regex(self, regex):
-        result = regex.match(self._input_value[self._index:])
+        return self._consume_regex(regex, required=True)
+
+    def _consume_regex(self, regex, required):
+        result = regex.match(self._input_value, self._index)
         if result is not None:
             return self._consume_matched_regex(result)
+        if not required:
+            return None
         raise ShorthandParseSyntaxError(self._input_value, '<%s>' % regex.name, '<none>', self._index)
 
     def _consume_matched_regex(self, result):
-        start, end = result.span()  # 매치된 문자열의 (시작, 끝)에 해당하는 튜플을 돌려준다.
-        v = self._input_value[self._index+start:self._index+end]
-        self._index += (end - start)
-        return v
+        # pos를 넘겨서 매치했으므로 span()은 입력 전체 기준의 (시작, 끝)이다.
+        self._index = result.end()
+        return result.group()
 
     def _backtrack_to(self, char):
-        while self._index >= 0 and self._input_value[self._index] != char:
-            self._index -= 1
+        # 한 글자씩 뒤로 가지 않고 rfind로 한번에 찾는다. (못 찾으면 -1인 것도 예전과 같음)
+        self._index = self._input_value.rfind(char, 0, self._index + 1)
 
     def _consume_whitespace(self):
-        while self._current() != _EOF and self._current() in string.whitespace:
-            self._index += 1
+        value, index = self._input_value, self._index
+        while index < len(value) and value[index] in self._WHITESPACE_CHARS:
+            index += 1
+        self._index = index
+
+
+class _SchemaMismatch(Exception):
+    # 변환 함수 안에서만 쓰인다. 파서가 잡아서 입력 위치를 붙인 ShorthandSchemaError로 바꿈
+    def __init__(self, expected, actual):
+        self.expected = expected
+        self.actual = actual
+
+
+def _compile_schema(schema):
+    """
+    스키마 하나를 값 변환 함수로 컴파일한다.
+    int, float, bool, str, list(문자열 리스트), [item 스키마], {key: 스키마} 를 지원.
+    파싱할 때마다 스키마를 해석하지 않도록 미리 함수로 만들어두는 것
+    """
+    if schema is str:
+        def convert(value):
+            if not isinstance(value, str):
+                raise _SchemaMismatch('<str>', value)
+            return value
+    elif schema is int or schema is float:
+        expected = '<%s>' % schema.__name__
+
+        def convert(value):
+            if not isinstance(value, str):
+                raise _SchemaMismatch(expected, value)
+            try:
+                return schema(value)
+            except ValueError:
+                raise _SchemaMismatch(expected, value)
+    elif schema is bool:
+        def convert(value):
+            if isinstance(value, str):
+                lowered = value.lower()
+                if lowered == 'true':
+                    return True
+                if lowered == 'false':
+                    return False
+            raise _SchemaMismatch('<bool>', value)
+    elif schema is list or isinstance(schema, list):
+        convert_item = _compile_schema(schema[0] if isinstance(schema, list) else str)
+
+        def convert(value):
+            if isinstance(value, dict):
+                raise _SchemaMismatch('<list>', value)
+            if not isinstance(value, list):
+                # foo=a 처럼 값이 하나면 원소 하나짜리 리스트
+                value = [value]
+            return [convert_item(item) for item in value]
+    elif isinstance(schema, dict):
+        fields = {key: _compile_schema(sub) for key, sub in schema.items()}
+        expected_key = '<one of: %s>' % ', '.join(sorted(fields))
+
+        def convert(value):
+            if not isinstance(value, dict):
+                raise _SchemaMismatch('<structure>', value)
+            result = {}
+            for key, val in value.items():
+                field = fields.get(key)
+                if field is None:
+                    raise _SchemaMismatch(expected_key, key)
+                result[key] = field(val)
+            return result
+    else:
+        raise TypeError('지원하지 않는 스키마 타입: %r' % (schema,))
+    return convert
+
+
+class SchemaShorthandParser(ShorthandParser):
+    """
+    JSON model(스키마)을 아는 ShorthandParser.
+    example:
+        parser = SchemaShorthandParser({'Name': str, 'Count': int, 'Tags': [str],
+                                        'Config': {'Enabled': bool, 'Ratio': float}})
+        parser.parse('Name=foo,Count=3,Tags=a')
+        # {'Name': 'foo', 'Count': 3, 'Tags': ['a']}
+    스키마는 생성할 때 변환 함수로 한번만 컴파일하고, 파싱하면서 keyval이 끝날 때마다 바로 변환한다.
+    그래서 결과를 다시 훑으면서 타입을 바꿀 필요가 없음.
+    스키마에 없는 key는 값을 읽기 전에 에러를 낸다.
+    """
+
+    def __init__(self, schema, cache_size=128, compact=False, profile=False):
+        super(SchemaShorthandParser, self).__init__(cache_size, compact, profile)
+        self._fields = {key: _compile_schema(sub) for key, sub in schema.items()}
+        self._expected_key = '<one of: %s>' % ', '.join(sorted(self._fields))
+
+    def _keyval(self):
+        # keyval = key "=" [values]
+        start = self._index
+        key = self._key()
+        self._expect('=', consume_whitespace=True)
+        field = self._fields.get(key)
+        if field is None:
+            raise ShorthandSchemaError(self._input_value, self._expected_key, key, start)
+        value_start = self._index
+        values = self._values()
+        try:
+            return key, field(values)
+        except _SchemaMismatch as e:
+            raise ShorthandSchemaError(self._input_value, e.expected, e.actual, value_start)
+
+
+def parse(value):
+    """
+    모듈 전역 파서로 파싱한다. ShorthandParser().parse(value)와 같음.
+    파서가 재진입 가능하므로 스레드 풀에서 요청마다 파서를 만들 필요 없이 이걸 부르면 된다.
+    """
+    return _parser.parse(value)
+
+
+def parse_many(values, workers=None, chunksize=256, compact=False):
+    """
+    많은 shorthand 문자열을 프로세스 풀에 나눠서 파싱한다.
+    example:
+        for result, error in parse_many(lines, workers=8):
+            if error is not None:
+                ...
+    입력 순서대로 (result, error)를 yield 하고, 둘 중 하나는 항상 None이다.
+    한 줄이 에러나도 배치 전체는 멈추지 않음.
+
+    프로세스 사이에 주고받는 비용(IPC, pickle)을 줄이려고 chunksize개씩 묶어서 보낸다.
+    입력을 한번에 다 읽지 않고 워커 수의 두 배만큼의 묶음만 동시에 띄워두므로
+    수천만 줄짜리 제너레이터를 넘겨도 메모리가 늘지 않는다.
+    :type values: iterable of str
+    :param values: 파싱할 문자열들
+    :param workers: 프로세스 수. None이면 CPU 개수, 1이면 풀 없이 현재 프로세스에서 파싱
+    :param chunksize: 워커에 한번에 보낼 문자열 개수
+    :param compact: True면 ShorthandParser(compact=True)처럼 결과를 FrozenMapping / tuple로.
+        결과를 큐에 잔뜩 쌓아두는 작업이면 메모리가 크게 준다.
+    :return: (result, error) 튜플 제너레이터
+    """
+    chunks = _chunked(values, chunksize)
+    if workers == 1:
+        for chunk in chunks:
+            for item in _parse_chunk(chunk, compact):
+                yield item
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_parse_chunk, chunk, compact))
+            if len(pending) >= workers * 2:
+                for item in pending.popleft().result():
+                    yield item
+        while pending:
+            for item in pending.popleft().result():
+                yield item
+
+
+def parse_file(path, offset=0, lineno=1, parser=None):
+    """
+    한 줄에 shorthand 하나씩 적힌 (수 GB짜리) 파일을 줄 단위로 파싱한다.
+    example:
+        for line in parse_file('specs.txt'):
+            if line.error is not None:
+                print('%d번째 줄: %s' % (line.lineno, line.error))
+            checkpoint(line.end, line.lineno + 1)
+        # 중간에 멈췄으면 저장해둔 위치부터 다시
+        for line in parse_file('specs.txt', offset=saved_end, lineno=saved_lineno):
+            ...
+    파일을 mmap 해서 줄바꿈은 mmap.find()로 찾고, 지금 줄만 bytes로 잘라서 디코딩한다.
+    그래서 파일 크기와 상관없이 파이썬 문자열로 올라오는 건 지금 줄 하나뿐이다.
+    빈 줄은 건너뛰고(줄 번호는 센다), 한 줄이 에러나도 멈추지 않음.
+    :param path: 파일 경로. utf-8, 줄바꿈은 \n 또는 \r\n
+    :param offset: 여기서부터 읽는다. 줄의 시작이어야 함 (이전에 받은 end)
+    :param lineno: offset에 있는 줄의 줄 번호
+    :param parser: 쓸 파서. None이면 모듈 전역 파서
+    :return: (lineno, offset, end, result, error) namedtuple 제너레이터.
+        result와 error 중 하나는 항상 None. error는 ShorthandParseError 또는 UnicodeDecodeError
+    """
+    if parser is None:
+        parser = _parser
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if offset >= size:
+            # 빈 파일은 mmap 할 수 없다.
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while offset < size:
+                newline = mm.find(b'\n', offset)
+                end = size if newline == -1 else newline + 1
+                try:
+                    line = mm[offset:end].decode('utf-8').rstrip('\r\n')
+                except UnicodeDecodeError as e:
+                    # utf-8이 아닌 줄도 파싱 에러처럼 그 줄만 에러로 내고 계속 간다.
+                    yield _FileLine(lineno, offset, end, None, e)
+                else:
+                    if line.strip():
+                        try:
+                            yield _FileLine(lineno, offset, end, parser.parse(line), None)
+                        except ShorthandParseError as e:
+                            yield _FileLine(lineno, offset, end, None, e)
+                offset = end
+                lineno += 1
+
+
+def _chunked(values, size):
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_chunk(values, compact=False):
+    # 워커 프로세스에서 실행됨. 그래서 pickle 할 수 있도록 모듈 최상위 함수로 둔다.
+    parser = ShorthandParser(compact=compact)
+    results = []
+    for value in values:
+        try:
+            results.append((parser.parse(value), None))
+        except ShorthandParseError as e:
+            results.append((None, e))
+    return results
+
+
+def _parse_segment(text, first, limit):
+    # parse_parallel()의 워커에서 실행됨. text[:limit]에 있는 keyval들을 [(key, value), ...]로.
+    # first가 아니면 text는 자른 ','로 시작하고, limit 뒤에는 lookahead용 다음 'key='가 붙어있다.
+    # 에러가 났거나 keyval이 limit을 넘어가면(잘못 자름) None
+    parser = ShorthandParser()
+    end = len(text) if limit is None else limit
+    result = parser._parse_fast(text[0 if first else 1:end])
+    if result is not None:
+        return list(result.items())
+    keyvals = []
+    start = 0
+    while True:
+        try:
+            result = parser._stream_keyval(text, start, first, limit)
+        except ShorthandParseError:
+            return None
+        if result is None:
+            return None
+        key, value, start = result
+        keyvals.append((key, value))
+        first = False
+        if limit is None:
+            if start >= end:
+                return keyvals
+        elif all(char in parser._WHITESPACE_CHARS for char in text[start:end]):
+            # 남은 공백 뒤가 바로 자른 ','
+            return keyvals
+
+
+_parser = ShorthandParser()
 
 
 class ShorthandParseError(Exception):
+    """
+    메시지(캐럿 ^으로 위치를 표시한 입력)는 str() 할 때 처음 만든다.
+    에러를 잡고 넘어가는 대량 검증에서는 메시지가 필요 없으니 문자열 작업을 건너뛰기 위함.
+    위치만 필요하면 details()나 index / expected / actual 속성을 쓰면 됨
+    """
+    _msg = None
+
+    def __str__(self):
+        if self._msg is None:
+            self._msg = self._construct_msg()
+        return self._msg
+
+    def details(self):
+        # 문자열을 만들지 않는 구조화된 에러 정보
+        return _ErrorDetails(self.index, self.expected, self.actual)
+
     def _error_location(self):
         consumed, remaining, num_spaces = self.value, '', self.index
         if '\n' in self.value[:self.index]:
@@ -298,7 +1165,7 @@ class ShorthandParseError(Exception):
             # foo=bar, \n
             # bar==baz
             #     ^
-            last_newline = self.value[:self.index].rindex('n')   # rindex() : 문자열의 마지막 위치 반환 (없으면 exception)
+            last_newline = self.value[:self.index].rindex('\n')   # rindex() : 문자열의 마지막 위치 반환 (없으면 exception)
             num_spaces = self.index - last_newline - 1
         if '\n' in self.value[self.index:]:
             # 나머지에 줄 바꿈이 있으면 값을 소모된 값과 남은 값으로 나눈다.
@@ -317,8 +1184,9 @@ class ShorthandParseSyntaxError(ShorthandParseError):
         self.expected = expected
         self.actual = actual
         self.index = index
-        msg = self._construct_msg()
-        super(ShorthandParseSyntaxError, self).__init__(msg)     # super(msg)로 될 수 있을 듯? python 3.0부터 된다든디
+        # 메시지 대신 생성자 인자를 args로 넘긴다. 그래야 pickle이 __init__으로 그대로 복원함
+        # (parse_many()에서 워커 프로세스가 에러를 돌려줄 때 필요)
+        super(ShorthandParseSyntaxError, self).__init__(value, expected, actual, index)
 
     def _construct_msg(self):
         msg = (
@@ -333,8 +1201,9 @@ class DuplicateKeyInObjectError(ShorthandParseError):
         self.key = key
         self.value = value
         self.index = index
-        msg = self._construct_msg()
-        super(DuplicateKeyInObjectError, self).__init__(msg)
+        self.expected = '<unique key>'
+        self.actual = key
+        super(DuplicateKeyInObjectError, self).__init__(key, value, index)
 
     def _construct_msg(self):
         msg = (
@@ -343,3 +1212,7 @@ class DuplicateKeyInObjectError(ShorthandParseError):
             "space."
         ) % (self.key, self._error_location())
         return msg
+
+
+class ShorthandSchemaError(ShorthandParseSyntaxError):
+    """SchemaShorthandParser에서 스키마에 없는 key를 만났거나 값을 타입대로 바꿀 수 없을 때"""
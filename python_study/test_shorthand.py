@@ -1,6 +1,14 @@
+import os
+import pickle
+import sys
+import tempfile
+import threading
 import unittest
-# from shorthand_parser import ShorthandParser
-from old_shorthand_parser import ShorthandParser
+from unittest import mock
+# old_shorthand_parser는 값에 띄어쓰기를 지원하지 않아서 이 테스트를 통과하지 못한다.
+# 두 파서가 같이 지원하는 문법은 test_shorthand_fuzz.py에서 비교함
+from shorthand_parser import ShorthandParser
+import shorthand_parser
 
 # unittest로 변경해보기
 # https://docs.python.org/ko/3/library/unittest.html
@@ -39,6 +47,436 @@ class TestShorthandParser(unittest.TestCase):
            {'foo': 'a space', 'bar': 'a space', 'baz': 'a space'})
 
     def can_parse(self, data, expected):
-        # actual = ShorthandParser().parse(data)
         actual = ShorthandParser().parse(data)
         self.assertEqual(actual, expected)
+
+
+class TestShorthandParserFastPath(unittest.TestCase):
+    # fast path와 기존 재귀 하강 파서의 결과가 같은지 비교
+    def test_fast_path_matches_reference(self):
+        for data in ['foo=bar', 'foo=a,b,c,bar=d,e,f', 'foo=,bar=',
+                     u'foo=✓,✓', 'foo=a,b=with trailing space  ',
+                     'foo=a=b', 'a=b, c = d ,e']:
+            self.assertEqual(self.parse(data), self.parse_reference(data))
+
+    def test_fast_path_is_used_for_flat_input(self):
+        self.assertEqual(shorthand_parser.ShorthandParser()._parse_fast('foo=a,b'),
+                         {'foo': ['a', 'b']})
+
+    def test_fast_path_falls_back(self):
+        parser = shorthand_parser.ShorthandParser()
+        for data in ["foo='a,b'", 'foo=[a,b]', 'foo={a=b}', 'foo=a\\,b', ' foo=bar',
+                     'foo=a,foo=b', 'foo=a,', 'foo=a,,b=c']:
+            self.assertIsNone(parser._parse_fast(data))
+
+    def test_reference_path_consumes_from_position(self):
+        # 따옴표가 있으면 재귀 하강 파서로 파싱된다.
+        self.assertEqual(self.parse('foo=\'a,b\',"c",d\\,e,bar=x'),
+                         {'foo': ['a,b', 'c', 'd,e'], 'bar': 'x'})
+        self.assertEqual(self.parse('foo="a",' + ','.join(['b'] * 1000)),
+                         {'foo': ['a'] + ['b'] * 1000})
+
+    def test_csv_lookahead_does_not_raise(self):
+        # 다음 keyval을 만났을 때 에러를 만들고 잡는 대신 lookahead로 판단해야 한다.
+        with mock.patch.object(shorthand_parser, 'ShorthandParseSyntaxError') as error:
+            self.assertEqual(self.parse_reference('foo=a,b,c=d,e=f'),
+                             {'foo': ['a', 'b'], 'c': 'd', 'e': 'f'})
+            self.assertEqual(self.parse_reference("foo='a',b,c=\"d\",e"),
+                             {'foo': ['a', 'b'], 'c': ['d', 'e']})
+        self.assertFalse(error.called)
+
+    def test_error_index_is_unchanged(self):
+        for data in ['foo=a,', 'foo=a,b c=d', 'foo=a,foo=b', 'foo', 'foo=bar]baz']:
+            with self.assertRaises(shorthand_parser.ShorthandParseError) as fast:
+                self.parse(data)
+            with self.assertRaises(shorthand_parser.ShorthandParseError) as reference:
+                self.parse_reference(data)
+            self.assertEqual(fast.exception.index, reference.exception.index)
+            self.assertEqual(str(fast.exception), str(reference.exception))
+
+    def parse(self, data):
+        return shorthand_parser.ShorthandParser().parse(data)
+
+    def parse_reference(self, data):
+        parser = shorthand_parser.ShorthandParser()
+        parser._input_value = data
+        parser._index = 0
+        return parser._parameter()
+
+
+class TestShorthandParserCache(unittest.TestCase):
+    def test_hit_and_miss(self):
+        parser = shorthand_parser.ShorthandParser(cache_size=2)
+        self.assertEqual(parser.parse_cached('Name=foo,Values=a,b'),
+                         {'Name': 'foo', 'Values': ['a', 'b']})
+        parser.parse_cached('Name=foo,Values=a,b')
+        self.assertEqual(parser.cache_info(), (1, 1, 2, 1))
+
+    def test_lru_eviction(self):
+        parser = shorthand_parser.ShorthandParser(cache_size=2)
+        parser.parse_cached('a=1')
+        parser.parse_cached('b=2')
+        parser.parse_cached('a=1')    # 'a=1'이 최근에 쓰였으므로 'b=2'가 버려진다.
+        parser.parse_cached('c=3')
+        self.assertEqual(list(parser._cache), ['a=1', 'c=3'])
+        self.assertEqual(parser.cache_info().currsize, 2)
+
+    def test_mutating_result_does_not_corrupt_cache(self):
+        parser = shorthand_parser.ShorthandParser()
+        result = parser.parse_cached("foo=[a,{b=c}],bar='x'")
+        result['foo'][1]['b'] = 'changed'
+        result['foo'].append('d')
+        result['new'] = 'key'
+        self.assertEqual(parser.parse_cached("foo=[a,{b=c}],bar='x'"),
+                         {'foo': ['a', {'b': 'c'}], 'bar': 'x'})
+
+    def test_errors_are_not_cached(self):
+        parser = shorthand_parser.ShorthandParser()
+        for _ in range(2):
+            with self.assertRaises(shorthand_parser.ShorthandParseError):
+                parser.parse_cached('foo')
+        self.assertEqual(parser.cache_info(), (0, 2, 128, 0))
+
+    def test_cache_disabled(self):
+        parser = shorthand_parser.ShorthandParser(cache_size=0)
+        parser.parse_cached('a=1')
+        self.assertEqual(parser.cache_info(), (0, 1, 0, 0))
+
+
+class TestShorthandParserStream(unittest.TestCase):
+    def test_same_result_as_parse(self):
+        for data in ['foo=bar', 'foo=a,b,c,bar=d,e,f', "foo=[a,{b='c,d'}],bar=x,y",
+                     'foo={a=[b,c],d=e},bar=a\\,b', 'foo=a, ,bar=b', u'foo=✓,✓']:
+            expected = shorthand_parser.ShorthandParser().parse(data)
+            # 한 글자씩 쪼개서 넣어도 결과가 같아야 한다.
+            pairs = list(shorthand_parser.ShorthandParser().parse_stream(data))
+            self.assertEqual(dict(pairs), expected)
+            self.assertEqual([key for key, _ in pairs], list(expected))
+
+    def test_yields_before_input_ends(self):
+        consumed = []
+
+        def chunks():
+            for chunk in ['foo=[a,', 'b],bar=', 'c,d,baz', '={x=y}']:
+                consumed.append(chunk)
+                yield chunk
+
+        stream = shorthand_parser.ShorthandParser().parse_stream(chunks())
+        self.assertEqual(next(stream), ('foo', ['a', 'b']))
+        self.assertEqual(len(consumed), 2)
+        self.assertEqual(next(stream), ('bar', ['c', 'd']))
+        self.assertEqual(len(consumed), 4)
+        self.assertEqual(list(stream), [('baz', {'x': 'y'})])
+
+    def test_errors(self):
+        parser = shorthand_parser.ShorthandParser()
+        for data in ['', 'foo', 'foo=a,', 'foo=[a', "foo='a"]:
+            with self.assertRaises(shorthand_parser.ShorthandParseSyntaxError):
+                list(parser.parse_stream([data[:3], data[3:]]))
+        with self.assertRaises(shorthand_parser.DuplicateKeyInObjectError):
+            list(parser.parse_stream(['foo=a,', 'bar=b,', 'foo=c']))
+
+
+class TestParseMany(unittest.TestCase):
+    def test_order_and_errors(self):
+        values = ['foo=%d' % i if i % 7 else 'foo' for i in range(100)]
+        for workers in (1, 2):
+            results = list(shorthand_parser.parse_many(values, workers=workers, chunksize=8))
+            self.assertEqual(len(results), 100)
+            for i, (result, error) in enumerate(results):
+                if i % 7:
+                    self.assertEqual(result, {'foo': str(i)})
+                    self.assertIsNone(error)
+                else:
+                    self.assertIsNone(result)
+                    self.assertIsInstance(error, shorthand_parser.ShorthandParseSyntaxError)
+                    self.assertEqual(error.index, 3)
+
+    def test_errors_can_be_pickled(self):
+        error = shorthand_parser.DuplicateKeyInObjectError('foo', 'foo=a,foo=b', 6)
+        copied = pickle.loads(pickle.dumps(error))
+        self.assertEqual((copied.key, copied.index, str(copied)),
+                         (error.key, error.index, str(error)))
+
+
+class TestShorthandParseError(unittest.TestCase):
+    def test_message_is_built_lazily(self):
+        with mock.patch.object(shorthand_parser.ShorthandParseSyntaxError,
+                               '_error_location', return_value='<location>') as location:
+            with self.assertRaises(shorthand_parser.ShorthandParseSyntaxError) as cm:
+                shorthand_parser.ShorthandParser().parse('foo=a,b,')
+            self.assertFalse(location.called)
+            self.assertIn('<location>', str(cm.exception))
+            str(cm.exception)
+        self.assertEqual(location.call_count, 1)
+
+    def test_details(self):
+        with self.assertRaises(shorthand_parser.ShorthandParseError) as cm:
+            shorthand_parser.ShorthandParser().parse('foo=bar]baz')
+        self.assertEqual(cm.exception.details(), (7, ',', ']'))
+        self.assertEqual(cm.exception.details().index, 7)
+        with self.assertRaises(shorthand_parser.ShorthandParseError) as cm:
+            shorthand_parser.ShorthandParser().parse('foo=a,foo=b')
+        self.assertEqual(cm.exception.details(), (6, '<unique key>', 'foo'))
+
+    def test_message(self):
+        with self.assertRaises(shorthand_parser.ShorthandParseError) as cm:
+            shorthand_parser.ShorthandParser().parse('foo=bar]baz')
+        self.assertEqual(str(cm.exception),
+                         "Expected: ',', received: ']' for input:\n"
+                         "foo=bar]baz\n"
+                         "       ^")
+
+
+class TestSchemaShorthandParser(unittest.TestCase):
+    SCHEMA = {
+        'Name': str,
+        'Count': int,
+        'Ratio': float,
+        'Enabled': bool,
+        'Values': list,
+        'Ports': [int],
+        'Config': {'Retries': int, 'Tags': [{'Key': str, 'Value': str}]},
+    }
+
+    def setUp(self):
+        self.parser = shorthand_parser.SchemaShorthandParser(self.SCHEMA)
+
+    def test_coerce(self):
+        # 따옴표가 없으면 fast path, 있으면 재귀 하강 파서. 둘 다 같은 결과여야 한다.
+        for data in ['Name=foo,Count=3,Ratio=0.5,Enabled=TRUE,Values=a,Ports=80,443',
+                     "Name='foo',Count=3,Ratio=0.5,Enabled=TRUE,Values=a,Ports=80,443"]:
+            self.assertEqual(self.parser.parse(data), {
+                'Name': 'foo', 'Count': 3, 'Ratio': 0.5, 'Enabled': True,
+                'Values': ['a'], 'Ports': [80, 443]})
+        self.assertEqual(
+            self.parser.parse('Config={Retries=2,Tags=[{Key=a,Value=b}]}'),
+            {'Config': {'Retries': 2, 'Tags': [{'Key': 'a', 'Value': 'b'}]}})
+
+    def test_unknown_key(self):
+        with self.assertRaises(shorthand_parser.ShorthandSchemaError) as cm:
+            self.parser.parse('Name=foo,Nmae=bar')
+        self.assertEqual(cm.exception.details().index, 9)
+        self.assertEqual(cm.exception.actual, 'Nmae')
+        with self.assertRaises(shorthand_parser.ShorthandSchemaError) as cm:
+            self.parser.parse('Config={Retry=2}')
+        self.assertEqual(cm.exception.actual, 'Retry')
+
+    def test_bad_value(self):
+        for data, expected, index in [('Name=foo,Count=three', '<int>', 15),
+                                      ('Enabled=yes', '<bool>', 8),
+                                      ('Name=a,b', '<str>', 5),
+                                      ('Ports=[80,http]', '<int>', 6),
+                                      ('Config=x', '<structure>', 7)]:
+            with self.assertRaises(shorthand_parser.ShorthandSchemaError) as cm:
+                self.parser.parse(data)
+            self.assertEqual(cm.exception.details()[:2], (index, expected))
+
+    def test_syntax_error_is_still_syntax_error(self):
+        with self.assertRaises(shorthand_parser.ShorthandParseSyntaxError) as cm:
+            self.parser.parse('Name')
+        self.assertNotIsInstance(cm.exception, shorthand_parser.ShorthandSchemaError)
+
+    def test_unsupported_schema(self):
+        with self.assertRaises(TypeError):
+            shorthand_parser.SchemaShorthandParser({'Name': dict})
+
+
+class TestShorthandParserCompact(unittest.TestCase):
+    def setUp(self):
+        self.parser = shorthand_parser.ShorthandParser(compact=True)
+
+    def test_parse(self):
+        # fast path, 재귀 하강 파서 둘 다
+        for data in ['Name=foo,Values=a,b', "Name='foo',Values=a,b"]:
+            result = self.parser.parse(data)
+            self.assertIsInstance(result, shorthand_parser.FrozenMapping)
+            self.assertEqual(result, {'Name': 'foo', 'Values': ('a', 'b')})
+        result = self.parser.parse('a={b=[c,{d=e}]},f=[]')
+        self.assertEqual(result, {'a': {'b': ('c', {'d': 'e'})}, 'f': ()})
+        self.assertIsInstance(result['a']['b'][1], shorthand_parser.FrozenMapping)
+
+    def test_strings_and_shapes_are_shared(self):
+        first = self.parser.parse('Name=' + 'x' * 3 + ',Values=a,b')
+        second = self.parser.parse('Name=' + 'x' * 3 + ',Values=b,c')
+        self.assertIs(list(first)[0], list(second)[0])
+        self.assertIs(first['Name'], second['Name'])
+        self.assertIs(first['Values'][1], second['Values'][0])
+        self.assertIs(first._shape, second._shape)
+
+    def test_read_only_and_hashable(self):
+        result = self.parser.parse('foo=a,b,bar={baz=c}')
+        with self.assertRaises(TypeError):
+            result['foo'] = 'x'
+        self.assertEqual(hash(result), hash(self.parser.parse('foo=a,b,bar={baz=c}')))
+        self.assertEqual(len(result), 2)
+        self.assertNotIn('baz', result)
+        with self.assertRaises(KeyError):
+            result['baz']
+
+    def test_pickle(self):
+        result = self.parser.parse('foo=a,b,bar={baz=c}')
+        copied = pickle.loads(pickle.dumps(result))
+        self.assertEqual(copied, result)
+        self.assertIs(copied._shape, result._shape)
+
+    def test_cached_stream_and_schema(self):
+        data = 'Name=foo,Ports=80,443'
+        expected = {'Name': 'foo', 'Ports': ('80', '443')}
+        self.assertIs(self.parser.parse_cached(data), self.parser.parse_cached(data))
+        self.assertEqual(self.parser.parse_cached(data), expected)
+        self.assertEqual(dict(self.parser.parse_stream([data[:7], data[7:]])), expected)
+        parser = shorthand_parser.SchemaShorthandParser(
+            {'Name': str, 'Ports': [int]}, compact=True)
+        self.assertEqual(parser.parse(data), {'Name': 'foo', 'Ports': (80, 443)})
+
+    def test_parse_many(self):
+        results = list(shorthand_parser.parse_many(['a=b,c', 'a'], workers=2, compact=True))
+        self.assertEqual(results[0], ({'a': ('b', 'c')}, None))
+        self.assertIsInstance(results[0][0], shorthand_parser.FrozenMapping)
+        self.assertIsNotNone(results[1][1])
+
+
+class TestParseParallel(unittest.TestCase):
+    def setUp(self):
+        self.parser = shorthand_parser.ShorthandParser()
+
+    def make_input(self, num_keys):
+        return ','.join("Key%d=[a,'b,c'],Name%d={x=\"y=z,w\"},Values%d=a,b"
+                        % (i, i, i) for i in range(num_keys))
+
+    def test_split_points(self):
+        data = 'a=[b,c=d],e={f=g},h="i,j=k",l=m,n,o=p'
+        points = self.parser._split_points(data, 1)
+        self.assertEqual([data[comma + 1] for comma, _ in points], ['e', 'h', 'l', 'o'])
+        self.assertEqual([data[end - 1] for _, end in points], ['='] * 4)
+
+    def test_same_as_parse(self):
+        data = self.make_input(200)
+        with mock.patch.object(shorthand_parser.ShorthandParser, 'parse') as parse:
+            result = self.parser.parse_parallel(data, workers=2, chunk_size=500)
+        parse.assert_not_called()
+        self.assertEqual(result, self.parser.parse(data))
+
+    def test_errors_are_same_as_parse(self):
+        data = self.make_input(50)
+        for bad in [data + ',Key3=dup', data.replace('Key40=[a', 'Key40=[a}', 1),
+                    data + ',Last=[a] ']:
+            with self.assertRaises(shorthand_parser.ShorthandParseError) as expected:
+                self.parser.parse(bad)
+            with self.assertRaises(shorthand_parser.ShorthandParseError) as actual:
+                self.parser.parse_parallel(bad, workers=2, chunk_size=100)
+            self.assertEqual((type(actual.exception), actual.exception.index, str(actual.exception)),
+                             (type(expected.exception), expected.exception.index,
+                              str(expected.exception)))
+
+
+class TestShorthandParserThreadSafety(unittest.TestCase):
+    def make_inputs(self, num):
+        # 따옴표가 있어서 전부 재귀 하강 파서를 탄다
+        return ["Key%d='v%d',List=[a,{b=%d}],Values=x,y%d" % (i, i, i, i) for i in range(num)]
+
+    def expected(self, i):
+        return {'Key%d' % i: 'v%d' % i, 'List': ['a', {'b': str(i)}], 'Values': ['x', 'y%d' % i]}
+
+    def test_shared_parser_from_many_threads(self):
+        parser = shorthand_parser.ShorthandParser()
+        inputs = self.make_inputs(200)
+        errors = []
+
+        def work(offset):
+            for i in range(offset, len(inputs), 8):
+                for parse in (parser.parse, parser.parse_cached, shorthand_parser.parse):
+                    if parse(inputs[i]) != self.expected(i):
+                        errors.append(inputs[i])
+
+        interval = sys.getswitchinterval()
+        # 스레드가 최대한 자주 바뀌게 해서 상태를 공유하면 바로 깨지도록
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(parser.cache_info().misses, 200)
+
+    def test_reentrant_with_stream(self):
+        parser = shorthand_parser.ShorthandParser()
+        stream = parser.parse_stream(["a='1',b=[2,3],", "c={d='4'}"])
+        self.assertEqual(next(stream), ('a', '1'))
+        self.assertEqual(parser.parse("x='y',z=[w]"), {'x': 'y', 'z': ['w']})
+        self.assertEqual(list(stream), [('b', ['2', '3']), ('c', {'d': '4'})])
+
+
+class TestParseFile(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(u"a=b,c=d\n\nname=✓\r\nbad\nlast=[1,2]".encode('utf-8'))
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_lines(self):
+        lines = list(shorthand_parser.parse_file(self.path))
+        self.assertEqual([(line.lineno, line.result) for line in lines], [
+            (1, {'a': 'b', 'c': 'd'}), (3, {'name': u'✓'}), (4, None), (5, {'last': ['1', '2']})])
+        self.assertIsInstance(lines[2].error, shorthand_parser.ShorthandParseSyntaxError)
+        self.assertEqual([(line.offset, line.end) for line in lines],
+                         [(0, 8), (9, 19), (19, 23), (23, 33)])
+
+    def test_resume(self):
+        lines = shorthand_parser.parse_file(self.path)
+        first = next(lines)
+        lines.close()
+        resumed = list(shorthand_parser.parse_file(self.path, first.end, first.lineno + 1))
+        self.assertEqual([line.lineno for line in resumed], [3, 4, 5])
+        self.assertEqual(list(shorthand_parser.parse_file(self.path, 33)), [])
+
+    def test_empty_file(self):
+        open(self.path, 'wb').close()
+        self.assertEqual(list(shorthand_parser.parse_file(self.path)), [])
+
+    def test_invalid_utf8_line(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'a=b\nc=\xff\nd=e\n')
+        lines = list(shorthand_parser.parse_file(self.path))
+        self.assertEqual([(line.lineno, line.result) for line in lines],
+                         [(1, {'a': 'b'}), (2, None), (3, {'d': 'e'})])
+        self.assertIsInstance(lines[1].error, UnicodeDecodeError)
+        self.assertEqual((lines[1].offset, lines[1].end), (4, 8))
+
+
+class TestShorthandParserProfile(unittest.TestCase):
+    def test_stats(self):
+        parser = shorthand_parser.ShorthandParser(profile=True)
+        parser.parse("a=b,c,d=[e],f={g='h'}")
+        parser.parse('x=y')
+        stats = parser.profile_stats()
+        self.assertEqual({name: value['calls'] for name, value in stats.items()
+                          if isinstance(value, dict) and 'calls' in value}, {
+            '_parse_fast': 2, '_keyval': 3, '_csv_value': 1, '_explicit_list': 1,
+            '_hash_literal': 1, '_consume_quoted': 1, '_backtrack_to': 1})
+        self.assertEqual(stats['backtracks'], 1)
+        self.assertEqual(stats['regex'], {'_FIRST_VALUE': 2, '_SECOND_VALUE': 2,
+                                          '_SINGLE_QUOTED': 1, '_DOUBLE_QUOTED': 0})
+        self.assertGreaterEqual(stats['_keyval']['time'], stats['_csv_value']['time'])
+
+        parser.profile_clear()
+        self.assertEqual(parser.profile_stats()['_keyval'], {'calls': 0, 'time': 0.0})
+        self.assertEqual(list(parser.parse_stream(['a="b"'])), [('a', 'b')])
+        self.assertEqual(parser.profile_stats()['regex']['_DOUBLE_QUOTED'], 1)
+
+    def test_schema_parser(self):
+        parser = shorthand_parser.SchemaShorthandParser({'a': int}, profile=True)
+        self.assertEqual(parser.parse("a='1'"), {'a': 1})
+        self.assertEqual(parser.profile_stats()['_keyval']['calls'], 1)
+
+    def test_disabled(self):
+        parser = shorthand_parser.ShorthandParser()
+        self.assertIsNone(parser.profile_stats())
+        self.assertNotIn('_keyval', parser._begin('a=b').__dict__)
@@ -0,0 +1,263 @@
+"""
+shorthand_parser 퍼징 테스트.
+최적화(fast path, 스트림, 캐시)를 믿기 전에 돌려보는 회귀 방지용.
+
+- 모델(dict)을 랜덤으로 만들고 shorthand 문자열로 렌더링한 다음, 파싱 결과가 모델과 같은지 본다.
+- 같은 입력에 대해 fast path / 재귀 하강 파서 / parse_stream / parse_cached 결과(에러 포함)가 같아야 한다.
+- parse_parallel()은 아무데서나 잘라도 parse()와 결과(에러 포함)가 같아야 한다.
+- old_shorthand_parser와는 둘 다 지원하는 문법(영숫자 키, 공백 없는 값, 리스트, 평평한 hash)에서만 비교한다.
+  old 쪽은 initial 커밋이라 따옴표, 공백 섞인 값, 중첩, 중복 키 검사가 없음.
+
+반복 횟수와 시드는 환경변수로 조절. 실패하면 메시지에 시드가 찍힘.
+
+    SHORTHAND_FUZZ_ITERATIONS=10000 SHORTHAND_FUZZ_SEED=42 python -m pytest test_shorthand_fuzz.py
+"""
+import os
+import random
+import string
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import old_shorthand_parser
+import shorthand_parser
+
+
+ITERATIONS = int(os.environ.get('SHORTHAND_FUZZ_ITERATIONS', 300))
+SEED = int(os.environ.get('SHORTHAND_FUZZ_SEED', 0))
+
+_KEY_CHARS = string.ascii_letters + string.digits + '-_.#/:'
+_COMMON_KEY_CHARS = string.ascii_letters + string.digits
+# 따옴표, 공백, \ , = [ ] { } 빼고 따옴표 없이 쓸 수 있는 글자들 + 유니코드 조금
+_PLAIN_CHARS = (string.ascii_letters + string.digits +
+                '!#$%&()*+-./:;<>?@^_`|~' + u'é✓가나中')
+_QUOTED_CHARS = _PLAIN_CHARS + ' \t\n,=[]{}\'"\\'
+_WHITESPACE = ('', '', '', ' ', '  ', '\n', '\t ')
+# 변이(mutation)할 때 끼워넣는 글자들. 문법상 의미 있는 글자 위주.
+_MUTATION_CHARS = ',=[]{}\'"\\ \n' + 'ab1' + u'✓'
+
+
+class ShorthandGenerator(object):
+    """
+    랜덤 모델을 만들고 그걸 shorthand 문자열로 렌더링함.
+    common=True면 old_shorthand_parser도 읽을 수 있는 문법만 씀.
+    """
+    def __init__(self, rng, common=False):
+        self.rng = rng
+        self.common = common
+
+    def model(self, max_keys=6, max_depth=3):
+        keys = set()
+        while len(keys) < self.rng.randint(1, max_keys):
+            keys.add(self._key())
+        return dict((key, self._value(max_depth)) for key in keys)
+
+    def render(self, model):
+        parts = []
+        for key, value in model.items():
+            parts.append('%s%s=%s%s' % (key, self._ws(), self._ws(),
+                                        self._render_top(value)))
+        return (self._ws() + ',' + self._ws()).join(parts)
+
+    def _key(self):
+        chars = _COMMON_KEY_CHARS if self.common else _KEY_CHARS
+        return ''.join(self.rng.choice(chars)
+                       for _ in range(self.rng.randint(1, 8)))
+
+    def _ws(self):
+        if self.common:
+            return ''
+        return self.rng.choice(_WHITESPACE)
+
+    def _value(self, depth):
+        kinds = ['str', 'str', 'list']
+        if depth > 0:
+            kinds.append('dict')
+        kind = self.rng.choice(kinds)
+        if kind == 'str':
+            return self._str()
+        elif kind == 'list':
+            if self.common or depth == 0:
+                return [self._str() for _ in range(self.rng.randint(0, 4))]
+            return [self._value(depth - 1) for _ in range(self.rng.randint(0, 4))]
+        if self.common:
+            # old 파서의 hash는 중첩을 못 읽음
+            return dict((self._key(), self._str())
+                        for _ in range(self.rng.randint(1, 3)))
+        return dict((self._key(), self._value(depth - 1))
+                    for _ in range(self.rng.randint(0, 3)))
+
+    def _str(self):
+        if self.common:
+            chars = _PLAIN_CHARS
+            return ''.join(self.rng.choice(chars)
+                           for _ in range(self.rng.randint(1, 8)))
+        if self.rng.random() < 0.3:
+            chars = _QUOTED_CHARS
+        else:
+            chars = _PLAIN_CHARS + '  ,'
+        return ''.join(self.rng.choice(chars)
+                       for _ in range(self.rng.randint(0, 8)))
+
+    def _render_top(self, value):
+        if (isinstance(value, list) and len(value) > 1 and
+                all(isinstance(item, str) for item in value) and
+                self.rng.random() < 0.6):
+            # 최상위 리스트는 csv로도 쓸 수 있다. csv는 원소가 두개 이상이어야 리스트가 됨.
+            rendered = [self._render_str(value[0], second=False)]
+            rendered.extend(self._render_str(item, second=True)
+                            for item in value[1:])
+            return (self._ws() + ',' + self._ws()).join(rendered)
+        return self._render(value)
+
+    def _render(self, value):
+        if isinstance(value, dict):
+            items = ['%s%s=%s%s' % (key, self._ws(), self._ws(), self._render(item))
+                     for key, item in value.items()]
+            return '{%s%s%s}' % (self._ws(), (self._ws() + ',' + self._ws()).join(items),
+                                 self._ws())
+        elif isinstance(value, list):
+            items = [self._render(item) for item in value]
+            return '[%s%s%s]' % (self._ws(), (self._ws() + ',' + self._ws()).join(items),
+                                 self._ws())
+        return self._render_str(value, second=False)
+
+    def _render_str(self, value, second):
+        if self._is_plain(value) and (self.common or self.rng.random() < 0.8):
+            return value.replace(',', '\\,')
+        quote = self.rng.choice('\'"')
+        escaped = value.replace('\\', '\\\\').replace(quote, '\\' + quote)
+        return quote + escaped + quote
+
+    def _is_plain(self, value):
+        # 앞뒤 공백은 파서가 먹어버리니 따옴표로 감싸야 그대로 나온다
+        return (value != '' and value == value.strip() and
+                all(char in _PLAIN_CHARS or char in ' ,' for char in value))
+
+    def mutate(self, value):
+        # 렌더링한 문자열을 조금 망가뜨림. 결과가 유효할 수도, 아닐 수도 있다.
+        chars = list(value)
+        for _ in range(self.rng.randint(1, 3)):
+            index = self.rng.randint(0, len(chars))
+            action = self.rng.choice(('insert', 'delete', 'replace'))
+            if action == 'insert' or not chars:
+                chars.insert(index, self.rng.choice(_MUTATION_CHARS))
+            elif index < len(chars):
+                if action == 'delete':
+                    del chars[index]
+                else:
+                    chars[index] = self.rng.choice(_MUTATION_CHARS)
+        return ''.join(chars)
+
+
+def _outcome(func, value):
+    # 결과 또는 에러를 비교할 수 있는 모양으로
+    try:
+        return 'ok', func(value)
+    except shorthand_parser.ShorthandParseError as e:
+        return type(e).__name__, e.index, str(e)
+
+
+def _parse_reference(value):
+    parser = shorthand_parser.ShorthandParser()
+    parser._input_value = value
+    parser._index = 0
+    return parser._parameter()
+
+
+class TestShorthandFuzz(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(SEED)
+
+    def assert_same(self, expected, actual, value, what):
+        self.assertEqual(expected, actual,
+                         '%s mismatch (seed=%d) for input: %r' % (what, SEED, value))
+
+    def inputs(self):
+        generator = ShorthandGenerator(self.rng)
+        for _ in range(ITERATIONS):
+            model = generator.model()
+            value = generator.render(model)
+            yield model, value, generator.mutate(value)
+
+    def test_round_trip(self):
+        parser = shorthand_parser.ShorthandParser()
+        for model, value, _ in self.inputs():
+            self.assert_same(('ok', model), _outcome(parser.parse, value),
+                             value, 'round trip')
+
+    def test_fast_path_matches_reference(self):
+        parser = shorthand_parser.ShorthandParser()
+        for _, value, mutated in self.inputs():
+            for current in (value, mutated):
+                self.assert_same(_outcome(_parse_reference, current),
+                                 _outcome(parser.parse, current),
+                                 current, 'fast path')
+
+    def test_profiled_parser_matches_parse(self):
+        parser = shorthand_parser.ShorthandParser()
+        profiled = shorthand_parser.ShorthandParser(profile=True)
+        for _, value, mutated in self.inputs():
+            for current in (value, mutated):
+                self.assert_same(_outcome(parser.parse, current),
+                                 _outcome(profiled.parse, current),
+                                 current, 'profile=True')
+
+    def test_stream_matches_parse(self):
+        parser = shorthand_parser.ShorthandParser()
+
+        def parse_stream(value):
+            chunks = []
+            index = 0
+            while index < len(value):
+                size = self.rng.randint(1, 16)
+                chunks.append(value[index:index + size])
+                index += size
+            result = {}
+            for key, item in parser.parse_stream(chunks):
+                result[key] = item
+            return result
+
+        for _, value, mutated in self.inputs():
+            for current in (value, mutated):
+                expected = _outcome(parser.parse, current)
+                actual = _outcome(parse_stream, current)
+                if expected[0] == 'ok':
+                    self.assert_same(expected, actual, current, 'parse_stream')
+                else:
+                    # 스트림은 에러 전까지의 keyval을 이미 내보냈을 수 있어서 에러 종류만 비교
+                    self.assert_same(expected[0], actual[0], current, 'parse_stream')
+
+    def test_cached_matches_parse(self):
+        parser = shorthand_parser.ShorthandParser(cache_size=8)
+        for _, value, mutated in self.inputs():
+            for current in (value, mutated, value):
+                self.assert_same(_outcome(parser.parse, current),
+                                 _outcome(parser.parse_cached, current),
+                                 current, 'parse_cached')
+
+    def test_parse_parallel_matches_parse(self):
+        # 자르는 로직만 보는 거라 프로세스 대신 스레드로. 조각을 아주 작게 해서 최대한 많이 자른다.
+        parser = shorthand_parser.ShorthandParser()
+        with ThreadPoolExecutor(2) as executor:
+            for _, value, mutated in self.inputs():
+                for current in (value, mutated):
+                    chunk_size = self.rng.randint(1, 20)
+                    self.assert_same(
+                        _outcome(parser.parse, current),
+                        _outcome(lambda v: parser.parse_parallel(
+                            v, chunk_size=chunk_size, executor=executor), current),
+                        current, 'parse_parallel')
+
+    def test_old_parser_agrees_on_common_grammar(self):
+        generator = ShorthandGenerator(self.rng, common=True)
+        new = shorthand_parser.ShorthandParser()
+        for _ in range(ITERATIONS):
+            model = generator.model(max_depth=1)
+            value = generator.render(model)
+            old = old_shorthand_parser.ShorthandParser()
+            self.assert_same(model, old.parse(value), value, 'old parser')
+            self.assert_same(model, new.parse(value), value, 'new parser')
+
+
+if __name__ == '__main__':
+    unittest.main()